@@ -3,7 +3,7 @@ from pathlib import Path
 from PySide6.QtWidgets import (
     QMainWindow, QSplitter, QStatusBar, QLabel, QMessageBox
 )
-from PySide6.QtCore import Qt, QSettings, QItemSelectionModel
+from PySide6.QtCore import Qt, QSettings, QItemSelectionModel, QTimer, QFileSystemWatcher, QCoreApplication
 
 # ---------- локальные блоки ----------
 from ui.tree_panel          import FileTreePanel
@@ -15,6 +15,13 @@ from widgets.log_panel import LogPanel
 from config import PROMPTS_DIR_NAME, SETTINGS_ORG_NAME, SETTINGS_APP_NAME
 from utils.path_helpers import find_or_ask_prompts_root, select_prompts_directory_dialog
 from utils.logger       import add_editor_log_handler, get_dsl_execution_logger, editor_logger, get_dsl_script_logger
+from utils.config_utils import (
+    merged_defaults_for_char, get_config_path,
+    read_config_json, try_read_config_json, write_config_json, are_configs_equal,
+    config_fingerprint
+)
+from utils.vars_text    import parse_vars_text
+from syntax.syntax_checker import PostScriptSyntaxChecker, SyntaxError as DslSyntaxError
 from dsl_manager        import DSL_ENGINE_AVAILABLE, CharacterClass
 from widgets.dsl_result_dialog import DslResultDialog
 
@@ -37,9 +44,12 @@ class PromptEditorWindow(QMainWindow):
     # -------------------------- helpers --------------------------
     @staticmethod
     def _dict2txt(d: dict) -> str:
-        return "\n".join(
-            f"{k}={str(v).lower() if isinstance(v, bool) else v}" for k, v in d.items()
-        )
+        parts = []; app = parts.append
+        for k, v in d.items():
+            if v is True:    app(f"{k}=true")
+            elif v is False: app(f"{k}=false")
+            else:            app(f"{k}={v}")
+        return "\n".join(parts)
 
     def _defaults_for(self, char_id: str | None) -> dict:
         if not char_id:
@@ -51,6 +61,10 @@ class PromptEditorWindow(QMainWindow):
                 return merged
         return Character.BASE_DEFAULTS.copy()
 
+    def _get_char_defaults(self, char_id: str) -> dict:
+        """Изменяемая копия дефолтов персонажа вместе с границами."""
+        return dict(merged_defaults_for_char(char_id))
+
     # -------------------------- init -----------------------------
     def __init__(self):
         super().__init__()
@@ -61,6 +75,12 @@ class PromptEditorWindow(QMainWindow):
         self.settings = QSettings(SETTINGS_ORG_NAME, SETTINGS_APP_NAME)
         self.selected_char: str | None = None
         self.prompts_root: str | None = None # Инициализируем prompts_root
+        # Снимок настроек, снятый в closeEvent и ещё не записанный на диск
+        self._pending_settings: dict | None = None
+        # (исходный текст панели, результат _parse_vars) — повторный разбор того же текста не нужен
+        self._parsed_vars_cache: tuple[str, dict] | None = None
+        if (app := QCoreApplication.instance()) is not None:
+            app.aboutToQuit.connect(self._flush_settings)
 
         # --- Определяем окончательный prompts_root ---
         # 1. Пытаемся загрузить из настроек
@@ -87,7 +107,12 @@ class PromptEditorWindow(QMainWindow):
                 self, self.settings, PROMPTS_DIR_NAME, cfg_path
             )
 
+        self._refresh_prompts_root_prefix()
         self.setWindowTitle(f"Редактор Промптов — {SETTINGS_APP_NAME}") # Устанавливаем базовый заголовок
+        # Последние выставленные тексты — чтобы не дёргать Qt одинаковыми строками
+        self._last_title = self.windowTitle()
+        self._last_path_text = "Нет открытых файлов"
+        self._last_title_char_id: str | None = None
 
         # --- Строим UI (FileTreePanel получит уже определенный self.prompts_root) ---
         self._build_ui() 
@@ -149,8 +174,23 @@ class PromptEditorWindow(QMainWindow):
         self.tabs.currentChanged.connect(self._update_title)
         self.vars_dock.reset_requested.connect(self._reset_vars)
         self.vars_dock.set_on_save_clicked(self._save_config_json_for_current_vars)
+        # Сравнение с config.json не нужно гонять на каждое нажатие клавиши
+        self._vars_debounce = QTimer(self)
+        self._vars_debounce.setSingleShot(True)
+        self._vars_debounce.setInterval(200)
+        self._vars_debounce.timeout.connect(self._refresh_save_enabled)
         self.vars_dock.editor().textChanged.connect(self._on_vars_text_changed)
 
+        # Наличие/изменение config.json отслеживаем вотчером, а не stat'ом на каждое обновление
+        self._cfg_exists = False
+        self._cfg_watcher = QFileSystemWatcher(self)
+        self._cfg_watch_debounce = QTimer(self)
+        self._cfg_watch_debounce.setSingleShot(True)
+        self._cfg_watch_debounce.setInterval(300)
+        self._cfg_watch_debounce.timeout.connect(self._on_config_fs_changed)
+        self._cfg_watcher.fileChanged.connect(self._cfg_watch_debounce.start)
+        self._cfg_watcher.directoryChanged.connect(self._cfg_watch_debounce.start)
+
         tb = self.addToolBar("DSL")
         self.run_act = tb.addAction("Скомпоновать промпт", self._run_dsl)
         self._update_run_dsl_state()
@@ -162,6 +202,7 @@ class PromptEditorWindow(QMainWindow):
         self._setup_loggers()
 
         self._baseline_cfg_dict = None
+        self._baseline_fp: tuple[dict | None, int | None] = (None, None)
         self._update_save_button_state()
 
 
@@ -196,7 +237,12 @@ class PromptEditorWindow(QMainWindow):
 
     # --------------------- tree -> персонаж ---------------------
     def _on_char_selected(self, char_id: str):
-        self.selected_char = char_id or None
+        new_sel = char_id or None
+        if new_sel == self.selected_char:
+            _log.debug("Персонаж не изменился (%s) — синхронизация панели пропущена", new_sel)
+            return
+        self.selected_char = new_sel
+        self._watch_config()
         self._sync_vars_panel()
         self._update_run_dsl_state()
 
@@ -205,7 +251,6 @@ class PromptEditorWindow(QMainWindow):
 
     # ---------------------- vars panel -------------------------
     def _sync_vars_panel(self):
-        from utils.config_utils import read_config_json, get_bounds_defaults, compute_defaults_for_char
         ed = self.vars_dock.editor(); ed.blockSignals(True)
         if self.selected_char:
             key = f"{self.selected_char.lower()}_vars"
@@ -217,10 +262,7 @@ class PromptEditorWindow(QMainWindow):
                 if cfg:
                     ed.setPlainText(self._dict2txt(cfg))
                 else:
-                    base = compute_defaults_for_char(self.selected_char)
-                    for k, v in get_bounds_defaults().items():
-                        base.setdefault(k, v)
-                    ed.setPlainText(self._dict2txt(base))
+                    ed.setPlainText(self._dict2txt(self._get_char_defaults(self.selected_char)))
             self._baseline_cfg_dict = read_config_json(self.prompts_root, self.selected_char)
         else:
             ed.clear()
@@ -260,7 +302,6 @@ class PromptEditorWindow(QMainWindow):
         self._apply_config_or_defaults_to_editor()
 
     def _apply_config_or_defaults_to_editor(self):
-        from utils.config_utils import read_config_json, get_bounds_defaults, compute_defaults_for_char
         ed = self.vars_dock.editor()
         if self.selected_char:
             cfg = read_config_json(self.prompts_root, self.selected_char)
@@ -268,10 +309,7 @@ class PromptEditorWindow(QMainWindow):
                 txt = self._dict2txt(cfg)
                 self._baseline_cfg_dict = cfg
             else:
-                base = compute_defaults_for_char(self.selected_char)
-                for k, v in get_bounds_defaults().items():
-                    base.setdefault(k, v)
-                txt = self._dict2txt(base)
+                txt = self._dict2txt(self._get_char_defaults(self.selected_char))
                 self._baseline_cfg_dict = None
             ed.setPlainText(txt)
             self.settings.setValue(f"{self.selected_char.lower()}_vars", txt)
@@ -283,7 +321,6 @@ class PromptEditorWindow(QMainWindow):
         self._update_save_button_state()
 
     def _save_config_json_for_current_vars(self):
-        from utils.config_utils import compute_defaults_for_char, get_bounds_defaults, write_config_json, get_config_path
         if not self.selected_char:
             QMessageBox.information(self, "config.json", "Персонаж не выбран.")
             return
@@ -292,11 +329,9 @@ class PromptEditorWindow(QMainWindow):
             return
         cfg_path = get_config_path(self.prompts_root, self.selected_char)
         current_vars = self._parse_vars()
-        final_cfg = compute_defaults_for_char(self.selected_char)
+        final_cfg = self._get_char_defaults(self.selected_char)
         final_cfg.update(current_vars)
-        for k, v in get_bounds_defaults().items():
-            final_cfg.setdefault(k, v)
-        if os.path.exists(cfg_path):
+        if os.path.isfile(cfg_path):
             r = QMessageBox.question(
                 self, "Перезаписать config.json?",
                 f"Файл уже существует:\n{cfg_path}\n\nПерезаписать его текущими значениями из панели?",
@@ -308,36 +343,68 @@ class PromptEditorWindow(QMainWindow):
             write_config_json(self.prompts_root, self.selected_char, final_cfg)
             QMessageBox.information(self, "config.json", f"Сохранено:\n{cfg_path}")
             txt = self._dict2txt(final_cfg)
-            self.vars_dock.editor().setPlainText(txt)
+            ed = self.vars_dock.editor()
+            ed.blockSignals(True); ed.setPlainText(txt); ed.blockSignals(False)
             self.settings.setValue(f"{self.selected_char.lower()}_vars", txt)
             self._baseline_cfg_dict = final_cfg
+            self._cfg_exists = True
             self._update_save_button_state()
         except Exception as e:
             QMessageBox.critical(self, "config.json", f"Ошибка сохранения:\n{e}")
 
     def _on_vars_text_changed(self):
+        self._parsed_vars_cache = None
+        self._vars_debounce.start()
+
+    def _watch_config(self):
+        """Перевешивает вотчер на config.json текущего персонажа (или его папку, пока файла нет)."""
+        if paths := self._cfg_watcher.files() + self._cfg_watcher.directories():
+            self._cfg_watcher.removePaths(paths)
+        cfg_path = get_config_path(self.prompts_root, self.selected_char)
+        self._cfg_exists = bool(cfg_path) and os.path.isfile(cfg_path)
+        if self._cfg_exists:
+            self._cfg_watcher.addPath(cfg_path)
+        elif cfg_path and os.path.isdir(os.path.dirname(cfg_path)):
+            self._cfg_watcher.addPath(os.path.dirname(cfg_path))
+
+    def _on_config_fs_changed(self):
+        # Файл могли создать, удалить или переписать снаружи — обновляем baseline
+        self._watch_config()
+        self._baseline_cfg_dict = (
+            read_config_json(self.prompts_root, self.selected_char) if self._cfg_exists else None
+        )
         self._update_save_button_state()
 
     def _update_save_button_state(self):
-        from utils.config_utils import get_config_path, read_config_json, are_configs_equal
-        have_char = bool(self.selected_char)
-        if not have_char:
-            self.vars_dock.update_save_button_text(False)
-            self.vars_dock.set_save_enabled(False)
-            return
-        cfg_path = get_config_path(self.prompts_root, self.selected_char)
-        exists = os.path.exists(cfg_path)
-        self.vars_dock.update_save_button_text(exists)
-        if not exists:
-            self.vars_dock.set_save_enabled(True)
-            return
-        baseline = self._baseline_cfg_dict if self._baseline_cfg_dict is not None else read_config_json(self.prompts_root, self.selected_char) or {}
-        current = self._parse_vars()
-        self.vars_dock.set_save_enabled(not are_configs_equal(current, baseline))
+        """Медленный путь: при необходимости перечитывает config.json и обновляет подпись кнопки."""
+        if self.selected_char and self._baseline_cfg_dict is None:
+            self._cfg_exists, self._baseline_cfg_dict = try_read_config_json(self.prompts_root, self.selected_char)
+        self.vars_dock.update_save_button_text(bool(self.selected_char) and self._cfg_exists)
+        self._refresh_save_enabled()
 
-    def _check_syntax(self):
-        from syntax.syntax_checker import PostScriptSyntaxChecker, SyntaxError  # Импортируем здесь, чтобы избежать циклических зависимостей
+    def _refresh_save_enabled(self):
+        self.vars_dock.set_save_enabled(self._fast_save_enabled_check())
+
+    def _fast_save_enabled_check(self) -> bool:
+        """Быстрый путь для набора текста: только кэшированные флаги и сравнение с baseline."""
+        if not self.selected_char:
+            return False
+        if not self._cfg_exists:
+            return True
+        return not self._configs_match_baseline(self._parse_vars(), self._baseline_cfg_dict or {})
+
+    def _configs_match_baseline(self, current: dict, baseline: dict) -> bool:
+        # Отпечаток baseline считаем один раз на объект; полное сравнение — только при совпадении
+        if self._baseline_fp[0] is not baseline:
+            self._baseline_fp = (baseline, config_fingerprint(baseline))
+        base_fp = self._baseline_fp[1]
+        if base_fp is not None:
+            cur_fp = config_fingerprint(current)
+            if cur_fp is not None and cur_fp != base_fp:
+                return False
+        return are_configs_equal(current, baseline)
 
+    def _check_syntax(self):
         current_editor = self.tabs.currentWidget()
         if not current_editor:
             QMessageBox.information(self, "Проверка синтаксиса", "Нет открытых файлов для проверки.")
@@ -350,7 +417,7 @@ class PromptEditorWindow(QMainWindow):
 
         file_content = current_editor.toPlainText()
         checker = PostScriptSyntaxChecker()
-        errors: List[SyntaxError] = []
+        errors: list[DslSyntaxError] = []
         
         if file_path.lower().endswith(".postscript"):
             errors = checker.check_postscript_syntax(file_content, file_path)
@@ -410,18 +477,12 @@ class PromptEditorWindow(QMainWindow):
             editor_logger.error(f"Error running DSL for {self.selected_char}: {e}", exc_info=True)
 
     def _parse_vars(self) -> dict:
-        out = {}
-        for line in self.vars_dock.editor().toPlainText().splitlines():
-            if "=" not in line: continue
-            k, v = map(str.strip, line.split("=", 1))
-            if v.lower() in ("true", "false"): v = v.lower() == "true"
-            else:
-                try: v = int(v)
-                except: 
-                    try: v = float(v)
-                    except: v = v.strip("'\"")
-            out[k] = v
-        return out
+        text = self.vars_dock.editor().toPlainText()
+        if self._parsed_vars_cache is not None and self._parsed_vars_cache[0] == text:
+            return dict(self._parsed_vars_cache[1])
+        out = parse_vars_text(text)
+        self._parsed_vars_cache = (text, out)
+        return dict(out)
 
     def _update_run_dsl_state(self):
         have_char = bool(self.prompts_root and self.selected_char)
@@ -442,6 +503,8 @@ class PromptEditorWindow(QMainWindow):
         
         if new_prompts_path:
             self.prompts_root = new_prompts_path #
+            self._refresh_prompts_root_prefix()
+            self._last_path_text = ""  # персонажа по пути нужно определить заново
             
             if hasattr(self.tree, 'update_prompts_root'):
                 self.tree.update_prompts_root(new_prompts_path)
@@ -458,6 +521,12 @@ class PromptEditorWindow(QMainWindow):
                                     QMessageBox.Yes | QMessageBox.No) == QMessageBox.Yes
 
     # --------------------- title & status ---------------------
+    def _refresh_prompts_root_prefix(self):
+        # normcase — для сравнения без учёта регистра/слешей на Windows
+        self._prompts_root_prefix = (
+            os.path.normcase(os.path.join(os.path.normpath(self.prompts_root), "")) if self.prompts_root else ""
+        )
+
     def _update_title(self):
         base = f"Редактор Промптов — {SETTINGS_APP_NAME}"
         ed   = self.tabs.currentWidget()
@@ -466,21 +535,27 @@ class PromptEditorWindow(QMainWindow):
         if hasattr(ed, "get_tab_file_path") and ed:
             path = ed.get_tab_file_path() or "Новый файл"
             star = "*" if ed.document().isModified() else ""
-            self.setWindowTitle(f"{os.path.basename(path)}{star} — {base}")
-            self.path_lbl.setText(path)
-
-            # Попытка определить персонажа из пути файла
-            if self.prompts_root and path != "Новый файл":
-                try:
-                    relative_path = Path(path).relative_to(self.prompts_root)
+            title, path_text = f"{os.path.basename(path)}{star} — {base}", path
+
+            # Попытка определить персонажа из пути файла (путь не менялся — персонаж тот же)
+            if path == self._last_path_text:
+                current_char_id = self._last_title_char_id
+            elif self._prompts_root_prefix and path != "Новый файл":
+                norm_path = os.path.normpath(path)
+                if os.path.normcase(norm_path).startswith(self._prompts_root_prefix):
                     # Предполагаем, что имя персонажа - это первая папка после prompts_root
-                    current_char_id = str(relative_path.parts[0])
-                except ValueError:
+                    rel = norm_path[len(self._prompts_root_prefix):]
+                    current_char_id = rel.split(os.sep, 1)[0] or None
+                else:
                     editor_logger.debug(f"Не удалось определить персонажа из пути файла (вне prompts_root): {path}")
-                except IndexError:
-                    editor_logger.debug(f"Путь к файлу слишком короткий для определения персонажа: {path}")
         else:
-            self.setWindowTitle(base); self.path_lbl.setText("Нет открытых файлов")
+            title, path_text = base, "Нет открытых файлов"
+
+        if title != self._last_title:
+            self.setWindowTitle(title); self._last_title = title
+        if path_text != self._last_path_text:
+            self.path_lbl.setText(path_text); self._last_path_text = path_text
+        self._last_title_char_id = current_char_id
 
         # Обновляем выбранного персонажа и UI, если он изменился
         if current_char_id != self.selected_char:
@@ -488,43 +563,64 @@ class PromptEditorWindow(QMainWindow):
 
     # ---------------- settings / loggers ----------------------
     def closeEvent(self, ev):
-        self._save_settings(); super().closeEvent(ev)
-
-    def _save_settings(self):
-        self.settings.setValue("windowState", self.saveState())
-        self.settings.setValue("splitter",    self.splitter.saveState())
+        # Значения снимаем сейчас (виджеты ещё живы), а пишем на диск уже после закрытия окна;
+        # aboutToQuit дописывает снимок, если цикл событий завершится раньше таймера
+        self._pending_settings = self._capture_settings()
+        QTimer.singleShot(0, self._flush_settings)
+        super().closeEvent(ev)
+
+    def _set_setting(self, key: str, value):
+        # Пишем только изменившиеся значения — QSettings сам кэширует прочитанное
+        if self.settings.value(key) != value:
+            self.settings.setValue(key, value)
+
+    def _capture_settings(self) -> dict:
+        """Снимок сохраняемых настроек; значение None — ключ нужно удалить."""
+        out = {
+            "windowState": self.saveState(),
+            "splitter":    self.splitter.saveState(),
+        }
         
         current_editor = self.tabs.currentWidget()
         if current_editor and hasattr(current_editor, 'get_tab_file_path'):
             last_file_path = current_editor.get_tab_file_path()
             if last_file_path:
-                self.settings.setValue("lastOpenedFile", last_file_path)
+                out["lastOpenedFile"] = last_file_path
         else:
-            self.settings.remove("lastOpenedFile") # Очищаем, если нет открытых файлов
+            out["lastOpenedFile"] = None # Очищаем, если нет открытых файлов
 
         if self.selected_char:
-            self.settings.setValue(
-                f"{self.selected_char.lower()}_vars",
-                self.vars_dock.editor().toPlainText()
-            )
+            out[f"{self.selected_char.lower()}_vars"] = self.vars_dock.editor().toPlainText()
         if self.prompts_root:
-            self.settings.setValue("lastPromptsDir", self.prompts_root)
+            out["lastPromptsDir"] = self.prompts_root
+        return out
+
+    def _flush_settings(self):
+        pending, self._pending_settings = self._pending_settings, None
+        if not pending:
+            return
+        for key, value in pending.items():
+            if value is not None:
+                self._set_setting(key, value)
+            elif self.settings.contains(key):
+                self.settings.remove(key)
+        self.settings.sync()
 
     def _load_settings(self):
         if (st := self.settings.value("windowState")): self.restoreState(st)
         if (sp := self.settings.value("splitter")):    self.splitter.restoreState(sp)
         if (last := self.settings.value("lastPromptsDir")) and os.path.isdir(last):
             self.prompts_root = last
+            self._refresh_prompts_root_prefix()
             self.tree.setRootIndex(self.tree.model().setRootPath(last))
 
     def _setup_loggers(self):
         h = self.log_dock.get_handler()
 
         # 1) Локальный редакторский логгер
-        from utils.logger import add_editor_log_handler, get_dsl_execution_logger, get_dsl_script_logger
         add_editor_log_handler(h)
 
         # 2) DSL-логгеры
         for l in (get_dsl_execution_logger(), get_dsl_script_logger()):
-            if l and all(existing is not h for existing in l.handlers):
+            if l and h not in l.handlers:
                 l.addHandler(h)
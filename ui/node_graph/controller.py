@@ -1,5 +1,6 @@
 # File: ui/node_graph/controller.py
 from __future__ import annotations
+from functools import lru_cache
 from typing import Dict, List, Optional, Set as PySet, Callable
 import logging
 
@@ -8,7 +9,7 @@ from PySide6.QtGui import QColor
 from PySide6.QtWidgets import QMessageBox
 
 from logic.dsl_ast import Script, AstNode, Set, Log, AddSystemInfo, Return, If
-from ui.node_graph.graph_primitives import NodeItem, PortItem
+from ui.node_graph.graph_primitives import EdgeItem, NodeItem, PortItem, color_from_name
 from ui.node_graph.graph_scene import GraphScene
 
 log = logging.getLogger("node_graph.controller")
@@ -16,6 +17,30 @@ log.setLevel(logging.DEBUG)
 log.propagate = True
 
 
+@lru_cache(maxsize=None)
+def _branch_key(idx: int) -> str:
+    # Ключи выходных портов веток — одна строка на индекс на всё время работы
+    return f"branch_{idx}"
+
+
+def _clip(text: str, n: int) -> str:
+    return text[:n] + "..." if len(text) > n else text
+
+
+# Листовые узлы: тип -> (заголовок, подзаголовок(node), ширина, описание)
+_LEAF_META: Dict[type, tuple[str, Callable[[AstNode], str], int, str]] = {
+    Set: ("Установить переменную",
+          lambda n: f"{'LOCAL ' if n.local else ''}{n.var} = {n.expr}", 320,
+          "Создаёт или изменяет переменную. LOCAL — видна только внутри текущего блока."),
+    Log: ("Записать в лог", lambda n: _clip(n.expr, 40), 320,
+          "Выводит значение выражения в лог для отладки."),
+    AddSystemInfo: ("Системная информация", lambda n: _clip(n.expr, 30), 340,
+                    "Добавляет системные инструкции, обычно загружает файл в начало промпта."),
+    Return: ("Вернуть результат", lambda n: _clip(n.expr, 35), 340,
+             "Возвращает итоговый текст промпта. Завершает выполнение скрипта."),
+}
+
+
 class NodeGraphController:
     """
     Управляет отображением AST на графе и синхронизацией.
@@ -26,28 +51,50 @@ class NodeGraphController:
         self.parent_map: Dict[str, List[AstNode]] = {}
         self.node2item: Dict[str, NodeItem] = {}
         self.item2node: Dict[NodeItem, AstNode] = {}
+        # id(тело ветки/else) -> IF, которому оно принадлежит
+        self.body_owner: Dict[int, AstNode] = {}
+        # Все тела (корень, ветки, else) — обновляются в rebuild и при создании else
+        self.bodies: List[List[AstNode]] = []
+        # Точки здесь не мутируются на месте — храним ссылки без копирования
         self.node_positions: Dict[str, QPointF] = {}
+        # (исходный NodeItem, ключ порта, целевой NodeItem) -> ребро, нарисованное refresh_edges
+        self._edges: Dict[tuple, EdgeItem] = {}
+        # Версия структуры AST: растёт при каждой правке, rebuild без изменений пропускается
+        self._ast_version = 0
+        self._built_version = -1
+        self._build_count = 0  # сколько раз сцена реально пересобиралась
         self.node_colors: Dict[str, QColor] = {}
-        self._on_metadata_changed: Optional[callable] = None
+        self._on_metadata_changed: Optional[Callable[[Optional[str]], None]] = None
         self._on_item_double_click: Optional[Callable[[AstNode], None]] = None
 
-    def set_metadata_changed_callback(self, cb: callable):
+    def set_metadata_changed_callback(self, cb: Callable[[Optional[str]], None]):
+        """cb(node_id) — позиция/цвет узла изменились; node_id=None — что-то вне AST (START)."""
         self._on_metadata_changed = cb
 
     def set_item_double_click_callback(self, cb: Callable[[AstNode], None]):
         self._on_item_double_click = cb
 
+    @property
+    def ast_version(self) -> int:
+        """Счётчик правок AST — ключ для кэшей, производных от структуры скрипта."""
+        return self._ast_version
+
+    @property
+    def build_count(self) -> int:
+        """Растёт при каждом фактическом rebuild (элементы сцены пересозданы)."""
+        return self._build_count
+
     def set_ast(self, script: Script):
         self.script = script
+        self.bodies = []
+        self._ast_version += 1
 
     def load_metadata(self, positions: Dict[str, tuple], colors: Dict[str, str]):
-        self.node_positions.clear()
         self.node_colors.clear()
-        for nid, (x, y) in positions.items():
-            self.node_positions[nid] = QPointF(x, y)
+        self.node_positions = {nid: QPointF(x, y) for nid, (x, y) in positions.items()}
         for nid, color_str in colors.items():
             try:
-                self.node_colors[nid] = QColor(color_str)
+                self.node_colors[nid] = color_from_name(color_str)
             except Exception:
                 pass
 
@@ -65,7 +112,11 @@ class NodeGraphController:
                 pass
         return positions, colors
 
-    def rebuild(self, keep_positions: bool = True):
+    def rebuild(self, keep_positions: bool = True, force: bool = False):
+        if keep_positions and not force and self._built_version == self._ast_version:
+            return
+        self._built_version = self._ast_version
+        self._build_count += 1
         for nid, item in list(self.node2item.items()):
             try:
                 self.node_positions[nid] = item.pos()
@@ -76,10 +127,18 @@ class NodeGraphController:
                 pass
 
         self.scene.clear()
+        self._edges = {}
         self.parent_map.clear()
+        self.body_owner.clear()
+        self.bodies = []
         self.node2item.clear()
         self.item2node.clear()
 
+        if not self.script.body:
+            # Пустой скрипт — раскладывать нечего
+            self.bodies = [self.script.body]
+            return
+
         NODE_W = 360
         NODE_H = 96
         COL_GAP = 140
@@ -87,111 +146,131 @@ class NodeGraphController:
         H_STEP = NODE_W + COL_GAP
         V_STEP = NODE_H + ROW_GAP
 
-        from logic.dsl_ast import If as IfNode
+        # Размеры поддеревьев за один rebuild не меняются — считаем каждый один раз
+        node_size: Dict[int, tuple[int, int]] = {}
+        block_size: Dict[int, tuple[int, int]] = {}
 
-        def measure_block(body: List[AstNode]) -> tuple[int, int]:
-            if not body:
-                return (1, 1)
+        # Все тела в прямом порядке; в обратном — вложенные раньше своих IF,
+        # поэтому размеры считаются одним плоским проходом без рекурсии
+        order: List[List[AstNode]] = [self.script.body]
+        i = 0
+        while i < len(order):
+            for n in order[i]:
+                if isinstance(n, If):
+                    order.extend(br.body for br in n.branches)
+                    if n.else_body is not None:
+                        order.append(n.else_body)
+            i += 1
+
+        for body in reversed(order):
             max_h = 1
             total_w = 0
             for n in body:
-                nh, nw = measure_node(n)
-                max_h = max(max_h, nh)
-                total_w += max(1, nw)
-            return (max_h, max(1, total_w))
-
-        def measure_node(n: AstNode) -> tuple[int, int]:
-            if isinstance(n, IfNode):
-                total_h = 0
-                max_w = 1
-                for br in n.branches:
-                    bh, bw = measure_block(br.body)
-                    total_h += max(1, bh)
-                    max_w = max(max_w, bw)
-                if n.else_body is not None:
-                    eh, ew = measure_block(n.else_body)
-                    total_h += max(1, eh)
-                    max_w = max(max_w, ew)
-                return (max(1, total_h), 1 + max(1, max_w))
-            return (1, 1)
-
-        pos_map: Dict[str, QPointF] = {}
-
-        def place_block(body: List[AstNode], col: int, row: int):
-            blk_h, _blk_w = measure_block(body)
+                if isinstance(n, If):
+                    r = getattr(n, "_cached_size", None)
+                    if r is None:
+                        total_h = 0
+                        max_w = 1
+                        for br in n.branches:
+                            bh, bw = block_size[id(br.body)]
+                            total_h += max(1, bh)
+                            max_w = max(max_w, bw)
+                        if n.else_body is not None:
+                            eh, ew = block_size[id(n.else_body)]
+                            total_h += max(1, eh)
+                            max_w = max(max_w, ew)
+                        r = (max(1, total_h), 1 + max(1, max_w))
+                        n._cached_size = r  # живёт между rebuild'ами, сбрасывается invalidate_sizes
+                else:
+                    r = (1, 1)
+                node_size[id(n)] = r
+                max_h = max(max_h, r[0])
+                total_w += max(1, r[1])
+            block_size[id(body)] = (max_h, max(1, total_w))
+        self.bodies = order
+
+        # Результат раскладки — параллельные плоские списки: узел / его позиция
+        flat_nodes: List[AstNode] = []
+        flat_pos: List[QPointF] = []
+
+        # Раскладка тел явным стеком (тело, колонка, строка) — без рекурсии
+        stack: List[tuple[List[AstNode], int, int]] = [(self.script.body, 0, 0)]
+        while stack:
+            body, col, row = stack.pop()
+            blk_h, _blk_w = block_size[id(body)]
             c = col
             for n in body:
-                nh, nw = measure_node(n)
+                nh, nw = node_size[id(n)]
                 row_center = row + max(0, (blk_h - nh) // 2)
-                pos_map[n.id] = QPointF(c * H_STEP, row_center * V_STEP)
+                flat_nodes.append(n)
+                flat_pos.append(QPointF(c * H_STEP, row_center * V_STEP))
                 self.parent_map[n.id] = body
 
-                if isinstance(n, IfNode):
+                if isinstance(n, If):
                     branch_row = row_center + 1
                     for br in n.branches:
-                        bh, _bw = measure_block(br.body)
-                        place_block(br.body, c + 1, branch_row)
-                        branch_row += max(1, bh)
+                        self.body_owner[id(br.body)] = n
+                        stack.append((br.body, c + 1, branch_row))
+                        branch_row += max(1, block_size[id(br.body)][0])
                     if n.else_body is not None:
-                        eh, _ew = measure_block(n.else_body)
-                        place_block(n.else_body, c + 1, branch_row)
-                        branch_row += max(1, eh)
+                        self.body_owner[id(n.else_body)] = n
+                        stack.append((n.else_body, c + 1, branch_row))
+                        branch_row += max(1, block_size[id(n.else_body)][0])
 
                 c += max(1, nw)
 
-        place_block(self.script.body, col=0, row=0)
+        saved = self.node_positions if keep_positions else {}
+        node2item = self.node2item
+        item2node = self.item2node
+        colors = self.node_colors
+        add_item = self.scene.add_node_item
 
-        def create_nodes(body: List[AstNode]):
-            for n in body:
+        # Массовая вставка без BSP-индекса и сигналов сцены — одна перерисовка в конце
+        with self.scene.batched_updates():
+            for n, p in zip(flat_nodes, flat_pos):
                 item = self._node_item_for(n)
-                self.node2item[n.id] = item
-                self.item2node[item] = n
-                p = self.node_positions.get(n.id) if keep_positions and (n.id in self.node_positions) else pos_map.get(n.id, QPointF(0, 0))
-                self.scene.add_node_item(item, p)
-                if n.id in self.node_colors:
-                    item.set_custom_color(self.node_colors[n.id])
+                node2item[n.id] = item
+                item2node[item] = n
+                sp = saved.get(n.id)
+                add_item(item, p if sp is None else sp)
+                c = colors.get(n.id)
+                if c is not None:
+                    item.set_custom_color(c)
                 item.set_move_callback(self._on_node_moved)
                 item.set_color_changed_callback(self._on_node_color_changed)
-                if isinstance(n, IfNode):
-                    for br in n.branches:
-                        create_nodes(br.body)
-                    if n.else_body:
-                        create_nodes(n.else_body)
-
-        create_nodes(self.script.body)
-        self.refresh_edges()
+            self.refresh_edges()
 
     def _on_node_moved(self, item: NodeItem):
-        for nid, it in self.node2item.items():
-            if it is item:
-                self.node_positions[nid] = item.pos()
-                if self._on_metadata_changed:
-                    self._on_metadata_changed()
-                break
+        node = self.item2node.get(item)
+        if node is None:
+            return
+        self.node_positions[node.id] = item.pos()
+        if self._on_metadata_changed:
+            self._on_metadata_changed(node.id)
 
     def _on_node_color_changed(self, item: NodeItem):
-        for nid, it in self.node2item.items():
-            if it is item:
-                custom_color = item.get_custom_color()
-                if custom_color:
-                    self.node_colors[nid] = custom_color
-                elif nid in self.node_colors:
-                    del self.node_colors[nid]
-                if self._on_metadata_changed:
-                    self._on_metadata_changed()
-                break
+        node = self.item2node.get(item)
+        if node is None:
+            return
+        custom_color = item.get_custom_color()
+        if custom_color:
+            self.node_colors[node.id] = custom_color
+        else:
+            self.node_colors.pop(node.id, None)
+        if self._on_metadata_changed:
+            self._on_metadata_changed(node.id)
 
     def create_item_for_node(self, node: AstNode, pos: QPointF) -> NodeItem:
         if node.id in self.node2item:
             it = self.node2item[node.id]
             it.setPos(pos)
-            self.node_positions[node.id] = QPointF(pos)
+            self.node_positions[node.id] = pos
             return it
         item = self._node_item_for(node)
         self.node2item[node.id] = item
         self.item2node[item] = node
         self.scene.add_node_item(item, pos)
-        self.node_positions[node.id] = QPointF(pos)
+        self.node_positions[node.id] = pos
         item.set_move_callback(self._on_node_moved)
         item.set_color_changed_callback(self._on_node_color_changed)
         if node.id in self.node_colors:
@@ -199,77 +278,77 @@ class NodeGraphController:
         return item
 
     def refresh_edges(self):
-        self.scene.clear_edges()
-
+        # Ожидаемые рёбра сверяются с уже нарисованными: живые и нужные остаются на месте,
+        # лишние удаляются, недостающие создаются
+        old = self._edges
+        new: Dict[tuple, EdgeItem] = {}
+        created = False
+        get_item = self.node2item.get
+        add_edge = self.scene.add_edge_between_ports
+
+        def link(src_item: NodeItem, key: str, dst_item: NodeItem, is_branch: bool = False):
+            k = (src_item, key, dst_item)
+            if k in new:
+                return
+            nonlocal created
+            e = old.pop(k, None)
+            if e is None or e.scene() is None:
+                created = True
+                e = add_edge(src_item.out_port(key), dst_item.in_port("exec"), is_branch=is_branch)
+            if e is not None:
+                new[k] = e
+
+        # Один проход по телу: рёбра между соседями, ветки IF и рекурсия в них
         def body_edges(body: List[AstNode]):
-            for i in range(len(body) - 1):
-                a = body[i]
-                if isinstance(a, Return):
-                    break
-                b = body[i + 1]
-                ia, ib = self.node2item.get(a.id), self.node2item.get(b.id)
-                if ia and ib:
-                    self.scene.add_edge_between_ports(ia.out_port("exec"), ib.in_port("exec"))
+            prev_item: Optional[NodeItem] = None
+            chained = True  # после RETURN соседей больше не связываем
             for n in body:
-                if isinstance(n, If):
-                    iif = self.node2item.get(n.id)
-                    if iif:
+                item = get_item(n.id)
+                if chained and prev_item is not None and item is not None:
+                    link(prev_item, "exec", item)
+                prev_item = item
+                if isinstance(n, Return):
+                    chained = False
+                elif isinstance(n, If):
+                    if item is not None:
                         for idx, br in enumerate(n.branches):
-                            if len(br.body) > 0:
-                                first = br.body[0]
-                                it_first = self.node2item.get(first.id)
+                            if br.body:
+                                it_first = get_item(br.body[0].id)
                                 if it_first:
-                                    self.scene.add_edge_between_ports(iif.out_port(f"branch_{idx}"), it_first.in_port("exec"))
-                        if n.else_body and len(n.else_body) > 0:
-                            first = n.else_body[0]
-                            it_first = self.node2item.get(first.id)
+                                    link(item, _branch_key(idx), it_first)
+                        if n.else_body:
+                            it_first = get_item(n.else_body[0].id)
                             if it_first:
-                                self.scene.add_edge_between_ports(iif.out_port("else"), it_first.in_port("exec"), is_branch=True)
+                                link(item, "else", it_first, is_branch=True)
                     for br in n.branches:
                         body_edges(br.body)
                     if n.else_body:
                         body_edges(n.else_body)
 
         body_edges(self.script.body)
+        changed = created or bool(old)
+        for e in old.values():
+            e.destroy()
+        self._edges = new
+        if changed:
+            # Структура поменялась — подсветка прошлого прогона на оставшихся рёбрах уже неверна
+            self.clear_path_highlight()
 
     def _node_item_for(self, node: AstNode) -> NodeItem:
-        from logic.dsl_ast import If
-        if isinstance(node, Set):
-            title = "Установить переменную"
-            subtitle = f"{'LOCAL ' if node.local else ''}{node.var} = {node.expr}"
-            desc = "Создаёт или изменяет переменную. LOCAL — видна только внутри текущего блока."
-            item = NodeItem(title, subtitle, node); item.setRect(0, 0, 320, 80); item.set_description(desc)
-        elif isinstance(node, Log):
-            title = "Записать в лог"
-            subtitle = node.expr[:40] + "..." if len(node.expr) > 40 else node.expr
-            desc = "Выводит значение выражения в лог для отладки."
-            item = NodeItem(title, subtitle, node); item.setRect(0, 0, 320, 80); item.set_description(desc)
-        elif isinstance(node, AddSystemInfo):
-            title = "Системная информация"
-            subtitle = node.expr[:30] + "..." if len(node.expr) > 30 else node.expr
-            desc = "Добавляет системные инструкции, обычно загружает файл в начало промпта."
-            item = NodeItem(title, subtitle, node); item.setRect(0, 0, 340, 80); item.set_description(desc)
-        elif isinstance(node, Return):
-            title = "Вернуть результат"
-            subtitle = node.expr[:35] + "..." if len(node.expr) > 35 else node.expr
-            desc = "Возвращает итоговый текст промпта. Завершает выполнение скрипта."
-            item = NodeItem(title, subtitle, node); item.setRect(0, 0, 340, 80); item.set_description(desc)
+        # Листовые типы собираются по таблице _LEAF_META — один lookup вместо цепочки isinstance
+        meta = _LEAF_META.get(type(node))
+        if meta is not None:
+            title, subtitle, w, desc = meta
+            item = NodeItem(title, subtitle(node), node); item.setRect(0, 0, w, 80); item.set_description(desc)
         elif isinstance(node, If):
-            title = "Условие"; subtitle = ""
-            desc = "Условная развилка: выполняет разные ветки кода в зависимости от условий."
-            item = NodeItem(title, subtitle, node)
-            branches_count = len(node.branches) + (1 if node.else_body is not None else 0)
-            base_h = 64; per_row = 28
-            h = base_h + max(1, branches_count) * per_row + 10; w = 360
-            item.setRect(0, 0, w, h); item.set_description(desc)
+            item = self._make_if_item(node)
         else:
             item = NodeItem(type(node).__name__, "", node); item.setRect(0, 0, 320, 80); item.set_description("")
         item.add_in_port("exec", "Выполнение")
-        from logic.dsl_ast import If as IfNode
         if not isinstance(node, Return): item.add_out_port("exec", "Далее")
-        if isinstance(node, IfNode):
+        if isinstance(node, If):
             for i, br in enumerate(node.branches):
-                item.add_out_port(f"branch_{i}", f"{br.cond}")
+                item.add_out_port(_branch_key(i), f"{br.cond}")
             if node.else_body is not None:
                 item.add_out_port("else", "Иначе")
         # dblclick -> отдаём наверх
@@ -277,6 +356,16 @@ class NodeGraphController:
             item.set_double_click_callback(lambda it, _n=node: self._on_item_double_click(_n))
         return item
 
+    def _make_if_item(self, node: If) -> NodeItem:
+        title = "Условие"; subtitle = ""
+        desc = "Условная развилка: выполняет разные ветки кода в зависимости от условий."
+        item = NodeItem(title, subtitle, node)
+        branches_count = len(node.branches) + (1 if node.else_body is not None else 0)
+        base_h = 64; per_row = 28
+        h = base_h + max(1, branches_count) * per_row + 10; w = 360
+        item.setRect(0, 0, w, h); item.set_description(desc)
+        return item
+
     # ---- подсветки ----
     def clear_all_previews(self):
         for it in list(self.node2item.values()):
@@ -349,9 +438,8 @@ class NodeGraphController:
             if not isinstance(ast, If):
                 continue
             parent = self.parent_map.get(ast.id, self.script.body)
-            try:
-                idx = parent.index(ast)
-            except ValueError:
+            idx = self._index_by_identity(parent, ast)
+            if idx < 0:
                 continue
             if idx + 1 >= len(parent):
                 continue
@@ -361,36 +449,49 @@ class NodeGraphController:
                 self._highlight_edge_any_out_to_exec_in(it_if, it_after)
 
     # ---- защита от циклов / манипуляции ----
+    def _body_owner_of(self, body: List[AstNode]) -> Optional[If]:
+        owner = self.body_owner.get(id(body))
+        # id() мог переиспользоваться после удаления тела — сверяем, что IF действительно им владеет
+        if isinstance(owner, If) and (owner.else_body is body or any(br.body is body for br in owner.branches)):
+            return owner
+        return None
+
     def _is_ancestor(self, potential_ancestor: AstNode, node: AstNode) -> bool:
-        visited: PySet[str] = set()
-        def check_parent(n: AstNode) -> bool:
-            if n.id in visited: return False
-            visited.add(n.id)
-            if n.id == potential_ancestor.id: return True
+        # Идём вверх по цепочке (предыдущий сосед / IF-владелец); visited — по id() объекта
+        target_id = potential_ancestor.id
+        visited: PySet[int] = set()
+        n: Optional[AstNode] = node
+        while n is not None:
+            key = id(n)
+            if key in visited:
+                return False
+            visited.add(key)
+            if n.id == target_id:
+                return True
             parent_body = self.parent_map.get(n.id)
-            if not parent_body: return False
-            from logic.dsl_ast import If as IfNode
-            for item, ast in list(self.item2node.items()):
-                if isinstance(ast, IfNode):
-                    for br in ast.branches:
-                        if br.body is parent_body: return check_parent(ast)
-                    if ast.else_body is parent_body: return check_parent(ast)
+            if not parent_body:
+                return False
+            owner = self._body_owner_of(parent_body)
+            if owner is not None:
+                n = owner
+                continue
+            idx = self._index_by_identity(parent_body, n)
+            n = parent_body[idx - 1] if idx > 0 else None
+        return False
+
+    def _detach_node(self, node: AstNode):
+        self._remove_from_parent(node)
+
+    @staticmethod
+    def _drop_port_edges(port: PortItem):
+        # Снимок в кортеж и очистка заранее — destroy() не будет удалять каждое ребро из списка порта
+        edges = tuple(port.edges)
+        port.edges.clear()
+        for e in edges:
             try:
-                idx = parent_body.index(n)
-                if idx > 0:
-                    return check_parent(parent_body[idx - 1])
+                e.destroy()
             except Exception:
                 pass
-            return False
-        return check_parent(node)
-
-    def _detach_node(self, node: AstNode):
-        for body in self._all_bodies():
-            if node in body:
-                body.remove(node)
-                break
-        if node.id in self.parent_map:
-            del self.parent_map[node.id]
 
     def connect_ports(self, src: PortItem, dst: PortItem):
         src_node = self.item2node.get(src.owner)
@@ -404,17 +505,10 @@ class NodeGraphController:
             return
 
         if src.key == "exec":
-            for e in list(src.edges):
-                try:
-                    e.destroy()
-                except Exception:
-                    pass
+            self._drop_port_edges(src)
 
             src_parent = self.parent_map.get(src_node.id, self.script.body)
-            try:
-                sidx = src_parent.index(src_node)
-            except ValueError:
-                sidx = -1
+            sidx = self._index_by_identity(src_parent, src_node)
 
             old_next = None
             if sidx >= 0 and sidx + 1 < len(src_parent):
@@ -424,6 +518,7 @@ class NodeGraphController:
             if sidx >= 0:
                 src_parent.insert(sidx + 1, dst_node)
                 self.parent_map[dst_node.id] = src_parent
+                self.mark_ast_changed(dst_node)
 
             if old_next and old_next is not dst_node:
                 if not isinstance(old_next, If):
@@ -431,15 +526,13 @@ class NodeGraphController:
             return
 
         if isinstance(src_node, If) and (src.key.startswith("branch_") or src.key == "else"):
-            for e in list(src.edges):
-                try:
-                    e.destroy()
-                except Exception:
-                    pass
+            self._drop_port_edges(src)
 
             if src.key == "else":
                 if src_node.else_body is None:
                     src_node.else_body = []
+                    self.body_owner[id(src_node.else_body)] = src_node
+                    self.bodies.append(src_node.else_body)
                 body = src_node.else_body
             else:
                 idx = int(src.key.split("_")[1])
@@ -451,24 +544,114 @@ class NodeGraphController:
             self._remove_from_parent(dst_node)
             body.insert(0, dst_node)
             self.parent_map[dst_node.id] = body
+            self.mark_ast_changed(dst_node)
             return
 
         src_parent = self.parent_map.get(src_node.id, self.script.body)
         self._remove_from_parent(dst_node)
-        try:
-            sidx = src_parent.index(src_node)
-        except ValueError:
+        sidx = self._index_by_identity(src_parent, src_node)
+        if sidx < 0:
             sidx = len(src_parent) - 1
         src_parent.insert(sidx + 1, dst_node)
         self.parent_map[dst_node.id] = src_parent
+        self.mark_ast_changed(dst_node)
+
+    def mark_ast_changed(self, node: Optional[AstNode] = None):
+        """Отмечает правку AST: поднимает ast_version (ключ кэшей и rebuild)
+        и сбрасывает размеры IF от node вверх. Вызывать после любой мутации скрипта."""
+        self._ast_version += 1
+        self.invalidate_sizes(node)
+
+    def invalidate_sizes(self, node: Optional[AstNode]):
+        """Сбрасывает закэшированные размеры IF от node вверх по цепочке владельцев."""
+        seen: PySet[int] = set()
+        while node is not None and id(node) not in seen:
+            seen.add(id(node))
+            if isinstance(node, If):
+                node._cached_size = None
+            body = self.parent_map.get(node.id)
+            node = self._body_owner_of(body) if body is not None else None
+
+    @staticmethod
+    def _index_by_identity(body: List[AstNode], node: AstNode) -> int:
+        # Сравнение по `is`: `in`/`index` дёргают __eq__ dataclass'а (глубокое сравнение)
+        for i, n in enumerate(body):
+            if n is node:
+                return i
+        return -1
 
     def _remove_from_parent(self, node: AstNode):
+        self.mark_ast_changed(node)
+        # parent_map знает тело узла; полный обход AST — только если запись устарела
+        body = self.parent_map.pop(node.id, None)
+        if body is not None and (i := self._index_by_identity(body, node)) >= 0:
+            del body[i]
+            return
         for body in self._all_bodies():
-            if node in body:
-                body.remove(node)
+            if (i := self._index_by_identity(body, node)) >= 0:
+                del body[i]
                 return
 
+    def insert_after(self, anchor: Optional[AstNode], node: AstNode):
+        """Вставляет node сразу после anchor в его теле; без anchor — в конец корня скрипта."""
+        body = self.parent_map.get(anchor.id, self.script.body) if anchor is not None else self.script.body
+        idx = self._index_by_identity(body, anchor) + 1 if anchor is not None else 0
+        if idx <= 0:
+            idx = len(body)
+        body.insert(idx, node)
+        self.parent_map[node.id] = body
+        self.mark_ast_changed(node)
+
+    def delete_node(self, node: AstNode):
+        self._remove_from_parent(node)
+
+    def delete_nodes(self, nodes: List[AstNode]):
+        """Удаляет узлы из AST; если сцена была актуальна — убирает только их элементы."""
+        in_sync = self._built_version == self._ast_version
+        for node in nodes:
+            self.delete_node(node)
+            self.remove_item_for_node(node)
+        if not in_sync:
+            self.rebuild(keep_positions=True)
+            return
+        # Остальные элементы стоят на своих местах — достаточно сверить рёбра
+        self._built_version = self._ast_version
+        self.refresh_edges()
+
+    def remove_item_for_node(self, node: AstNode):
+        """Убирает со сцены элемент узла и (для IF) всех вложенных в него узлов."""
+        dropped: PySet[int] = set()
+        stack: List[AstNode] = [node]
+        while stack:
+            n = stack.pop()
+            if isinstance(n, If):
+                for br in n.branches:
+                    dropped.add(id(br.body))
+                    stack.extend(br.body)
+                if n.else_body is not None:
+                    dropped.add(id(n.else_body))
+                    stack.extend(n.else_body)
+            if n is not node:
+                self.parent_map.pop(n.id, None)
+            item = self.node2item.pop(n.id, None)
+            if item is None:
+                continue
+            self.item2node.pop(item, None)
+            # рёбра этого элемента снимет refresh_edges/_draw_start_edge
+            if item.scene() is self.scene:
+                self.scene.removeItem(item)
+        if dropped:
+            for key in dropped:
+                self.body_owner.pop(key, None)
+            self.bodies = [b for b in self.bodies if id(b) not in dropped]
+
     def _all_bodies(self) -> List[List[AstNode]]:
+        # Список ведётся инкрементально; полный обход — только если rebuild ещё не было
+        if not self.bodies:
+            self.bodies = self._collect_bodies()
+        return self.bodies
+
+    def _collect_bodies(self) -> List[List[AstNode]]:
         res: List[List[AstNode]] = [self.script.body]
         def walk(body: List[AstNode]):
             for n in body:
@@ -478,4 +661,4 @@ class NodeGraphController:
                     if n.else_body is not None:
                         res.append(n.else_body); walk(n.else_body)
         walk(self.script.body)
-        return res
\ No newline at end of file
+        return res
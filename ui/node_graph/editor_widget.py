@@ -1,50 +1,98 @@
 # File: ui/node_graph/editor_widget.py
 # File: ui/node_graph/editor_widget.py
 from __future__ import annotations
-from typing import Optional, List, Dict, Any, Tuple, Callable, Set
+from typing import Optional, List, Dict, Any, Tuple, Callable, Set, TYPE_CHECKING
 import os
 import re
+import functools
 import logging
 import traceback
-import json
+from collections import OrderedDict
+from contextlib import contextmanager
 
-from PySide6.QtCore import Qt, Signal, QPointF, QTimer
+from PySide6.QtCore import Qt, Signal, QPointF, QRectF, QTimer
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QSplitter,
     QLabel, QPlainTextEdit, QMenu, QMessageBox, QFileDialog, QDialog, QDialogButtonBox
 )
-from PySide6.QtGui import QShortcut, QKeySequence, QFont
+from PySide6.QtGui import QShortcut, QKeySequence, QFont, QTextCursor
 
 from logic.dsl_ast import Script, Set, Log, AddSystemInfo, Return, If, IfBranch, AstNode
 from logic.dsl_parser import parse_script, ParseError
 from logic.dsl_codegen import generate_script
-from logic.dsl_runner import DslAstRunner, RunnerReport, NodeRunInfo
 from ui.node_graph.graph_scene import GraphScene, GraphView
-from ui.node_graph.graph_primitives import NodeItem, PortItem
+from ui.node_graph.graph_primitives import NodeItem, PortItem, color_from_name
 from ui.node_graph.inspector_widget import Inspector
 from ui.node_graph.controller import NodeGraphController
 from ui.node_graph.preview_highlighter import SimplePromptHighlighter
-from ui.node_graph.runner_result_dialog import RunnerResultDialog
+from utils import json_fast
+from utils.vars_text import parse_vars_text
+
+if TYPE_CHECKING:  # раннер и диалог результата нужны только при запуске воркфлоу
+    from logic.dsl_runner import RunnerReport, NodeRunInfo
 
 log = logging.getLogger("node_graph.editor")
 log.setLevel(logging.DEBUG)
 log.propagate = True
 
 
+def _common_affixes(a: str, b: str) -> Tuple[int, int]:
+    """Длины общего префикса и (непересекающегося с ним) суффикса — сравнение срезами."""
+    n = min(len(a), len(b))
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]: lo = mid
+        else:                  hi = mid - 1
+    pre = lo
+    lo, hi = 0, n - pre
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]: lo = mid
+        else:                                    hi = mid - 1
+    return pre, lo
+
+
+def _utf16_len(s: str) -> int:
+    # позиции QTextCursor — в UTF-16 единицах, а не в символах Python
+    return len(s.encode("utf-16-le")) // 2
+
+
 class NodeGraphEditor(QWidget):
     text_updated = Signal(str)
 
-    _INLINE_LOAD_RE = re.compile(
+    # LOAD [TAG] FROM "path" | LOAD_REL "path" — одна альтернатива, один проход по тексту
+    _LOAD_ANY_RE = re.compile(
         r"""\bLOAD
-             (?:\s+([A-Z0-9_]+))?
-             \s+FROM\s+
-             (['"])(.+?)\2
+             (?:
+                 (?:\s+(?P<tag>[A-Z0-9_]+))?
+                 \s+FROM\s+
+                 (?P<q1>['"])(?P<inline>.+?)(?P=q1)
+               |
+                 (?:_REL|REL)\s+
+                 (?P<q2>['"])(?P<rel>.+?)(?P=q2)
+             )
         """,
         re.IGNORECASE | re.VERBOSE,
     )
-    _LOAD_REL_RE = re.compile(r"""\bLOAD(?:_REL|REL)\s+(['"])(.+?)\1""", re.IGNORECASE)
     _SECTION_MARKER_RE = re.compile(r"^[ \t]*\[(?:#|/)\s*[A-Z0-9_]+\s*\][ \t]*\r?\n?", re.IGNORECASE | re.MULTILINE)
-    _TAG_SECTION_RE_TMPL = r"\[#\s*{tag}\s*\](.*?)\s*\[/\s*{tag}\s*\]"
+    # Секция [#TAG]...[/TAG] ищется двумя поисками по маркерам (оба начинаются с литерала)
+    _TAG_OPEN_RE_TMPL = r"\[#\s*{tag}\s*\]"
+    _TAG_CLOSE_RE_TMPL = r"\[/\s*{tag}\s*\]"
+
+    # Пункты меню создания: подпись -> конструктор узла по умолчанию
+    _CREATE_MENU: Tuple[Tuple[str, Callable[[], AstNode]], ...] = (
+        ("SET", lambda: Set(var="var", expr="0", local=False)),
+        ("LOG", lambda: Log(expr='"debug"')),
+        ("ADD_SYSTEM_INFO", lambda: AddSystemInfo(expr='LOAD "Main/part.txt"')),
+        ("RETURN", lambda: Return(expr='"text"')),
+        ("IF", lambda: If(branches=[IfBranch(cond="True")])),
+    )
+
+    # Окно деталей узла: больше этого — сначала только начало текста
+    _DETAILS_FULL_LIMIT = 200_000
+    _DETAILS_HEAD_CHARS = 100_000
+    _details_font_cache: Optional[QFont] = None
 
     def __init__(self, base_dir: Optional[str] = None, prompts_root: Optional[str] = None, 
                  file_path: Optional[str] = None, parent=None):
@@ -54,12 +102,36 @@ class NodeGraphEditor(QWidget):
         self._file_path = file_path
         self._meta_sidecar_path = self._get_sidecar_meta_path()
         self._sidecar_meta: Dict[str, Any] = {}
+        self._last_meta_payload: Optional[bytes] = None  # последнее записанное содержимое сайдкара
+        self._applied_meta_key: Optional[Tuple[int, int]] = None  # (версия AST, номер rebuild) последнего применения
+        # записи узлов последнего сохранения и id узлов, изменившихся с тех пор
+        self._store_nodes: Optional[Dict[str, Dict[str, Any]]] = None
+        self._store_version: int = -1
+        self._dirty_meta_ids: set[str] = set()
         self._ast: Script = Script()
         self._errors: List[ParseError] = []
         self._start_item: Optional[NodeItem] = None
         self._start_pos: QPointF = QPointF(-320, 0)
         self._vars_provider: Optional[Callable[[], Dict[str, Any]]] = None
         self._last_runner_report: Optional[RunnerReport] = None
+        # текст generate_script для версии AST из контроллера
+        self._codegen_version: int = -1
+        self._codegen_text: str = ""
+        # текст последнего разбора превью и версия AST сразу после него
+        self._parsed_text: Optional[str] = None
+        self._parsed_version: int = -1
+        # плоский индекс AST (параллельные списки: узлы / ключи сайдкара) для версии AST
+        self._flat_version: int = -1
+        self._flat_nodes: List[AstNode] = []
+        self._flat_keys: List[str] = []
+        self._flat_key_of: Dict[str, str] = {}
+        # path -> ((st_mtime_ns, st_size), текст) — файлы из LOAD для превью, LRU
+        self._file_cache: OrderedDict[str, Tuple[Tuple[int, int], str]] = OrderedDict()
+        # rel из LOAD -> найденный абсолютный путь
+        self._resolved_paths: Dict[str, str] = {}
+        self._abs_roots_cache: Optional[Tuple[str, ...]] = None
+        # expr -> (текст превью, ((rel, штамп файла), ...)); LRU на 512 выражений
+        self._preview_cache: OrderedDict[str, Tuple[str, tuple]] = OrderedDict()
 
         # дебаунс автосохранения меты
         self._meta_save_timer = QTimer(self)
@@ -67,6 +139,22 @@ class NodeGraphEditor(QWidget):
         self._meta_save_timer.setInterval(600)
         self._meta_save_timer.timeout.connect(lambda: self._save_sidecar_meta(silent=True))
 
+        # серия правок подряд -> одна подгонка сцены и одна перегенерация превью
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.setInterval(50)
+        self._refresh_timer.timeout.connect(self._do_refresh)
+
+        self._create_menu: Optional[QMenu] = None
+        self._create_factories: Dict[Any, Callable[[], AstNode]] = {}
+
+        # правки из инспектора (по символу) -> одна перестройка графа на серию
+        self._ast_rebuild_pending = False
+        self._ast_timer = QTimer(self)
+        self._ast_timer.setSingleShot(True)
+        self._ast_timer.setInterval(60)
+        self._ast_timer.timeout.connect(self._apply_ast_changes)
+
         # UI
         self.scene = GraphScene(self)
         self.view = GraphView(self.scene, self)
@@ -89,7 +177,10 @@ class NodeGraphEditor(QWidget):
         self.preview.setReadOnly(False)
         self.preview.setStyleSheet("background:#1f2329;color:#e6edf3;")
         self.preview.setPlaceholderText("Сгенерированный .script / редактируемый текст")
-        SimplePromptHighlighter(self.preview.document())
+        # Без переносов блоки раскладываются по одной строке — дешевле на длинных скриптах
+        self.preview.setLineWrapMode(QPlainTextEdit.NoWrap)
+        # Правки превью идут точечно (_refresh_preview), и Qt перекрашивает только изменённые блоки
+        self._highlighter = SimplePromptHighlighter(self.preview.document())
 
         # --------- Buttons row ---------
         self.btn_from_text = QPushButton("Пересобрать граф из текста")
@@ -102,7 +193,7 @@ class NodeGraphEditor(QWidget):
         self.btn_run.setToolTip("Выполнить от START до RETURN. Показать превью под узлами и итог.")
         self.btn_clear_previews = QPushButton("Очистить превью узлов")
 
-        self.btn_from_text.clicked.connect(self._rebuild_from_preview_text)
+        self.btn_from_text.clicked.connect(lambda: self._rebuild_from_preview_text())
         self.btn_to_text.clicked.connect(self._apply_ast_to_preview)
         self.btn_toggle_preview.clicked.connect(self._toggle_preview)
         self.btn_save_meta.clicked.connect(lambda: self._save_sidecar_meta(silent=False))
@@ -174,44 +265,81 @@ class NodeGraphEditor(QWidget):
 
     def _load_sidecar_meta(self):
         self._sidecar_meta = {}
+        self._applied_meta_key = None
+        self._last_meta_payload = None
         path = self._meta_sidecar_path
         if not os.path.exists(path):
             return
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f) or {}
+            with open(path, "rb") as f:
+                raw = f.read()
+            data = json_fast.loads(raw) if raw.strip() else {}
+            if not isinstance(data, dict):
+                log.error("Meta load error: ожидался объект, получено %s", type(data).__name__)
+                return
             self._sidecar_meta = data
+            self._last_meta_payload = raw  # тот же файл повторно не перезаписываем
             if isinstance(data.get("start_pos"), list) and len(data["start_pos"]) == 2:
                 self._start_pos = QPointF(float(data["start_pos"][0]), float(data["start_pos"][1]))
         except Exception as e:
             log.error("Meta load error: %s", e)
 
+    @staticmethod
+    def _meta_entry(item: NodeItem) -> Dict[str, Any]:
+        pos = item.pos()
+        entry: Dict[str, Any] = {"pos": [float(pos.x()), float(pos.y())]}
+        col = item.get_custom_color()
+        if col:
+            entry["color"] = col.name()
+        return entry
+
+    def _invalidate_meta_store(self):
+        # Элементы сцены пересозданы — частичное обновление меты больше невалидно
+        self._store_nodes = None
+
     def _save_sidecar_meta(self, silent: bool = True):
-        nodes_seq = self._enumerate_nodes(self._ast)
-        counters: Dict[str, int] = {}
-        store_nodes: Dict[str, Dict[str, Any]] = {}
-        for n in nodes_seq:
-            key = self._signature(n)
-            idx = counters.get(key, 0) + 1
-            counters[key] = idx
-            full_key = f"{key}#{idx}"
-            item = self.controller.node2item.get(n.id)
-            if not item:
-                continue
-            pos = item.pos()
-            entry: Dict[str, Any] = {"pos": [float(pos.x()), float(pos.y())]}
-            col = item.get_custom_color()
-            if col:
-                entry["color"] = col.name()
-            store_nodes[full_key] = entry
+        get_item = self.controller.node2item.get
+        ver = self.controller.ast_version
+        store_nodes = self._store_nodes
+        if store_nodes is None or self._store_version != ver or not silent:
+            store_nodes = {}
+            for n, full_key in zip(*self._flat_index()):
+                item = get_item(n.id)
+                if item:
+                    store_nodes[full_key] = self._meta_entry(item)
+            self._store_nodes = store_nodes
+            self._store_version = ver
+        else:
+            # Структура та же — пересчитываем только сдвинутые/перекрашенные узлы
+            self._flat_index()
+            key_of = self._flat_key_of
+            for nid in self._dirty_meta_ids:
+                full_key = key_of.get(nid)
+                if full_key is None:
+                    continue
+                item = get_item(nid)
+                if item:
+                    store_nodes[full_key] = self._meta_entry(item)
+                else:
+                    store_nodes.pop(full_key, None)
+        self._dirty_meta_ids.clear()
 
         data = {
             "start_pos": [float(self._start_pos.x()), float(self._start_pos.y())],
             "nodes": store_nodes
         }
         try:
-            with open(self._meta_sidecar_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            payload = json_fast.dumps(data, indent=True)
+            path = self._meta_sidecar_path
+            # Автосохранение с тем же содержимым — файл не трогаем
+            if silent and payload == self._last_meta_payload and os.path.exists(path):
+                return
+            # Пишем во временный файл и атомарно подменяем — без полузаписанной меты
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(payload)
+            os.replace(tmp, path)
+            self._last_meta_payload = payload
             if not silent:
                 QMessageBox.information(self, "Метаданные", "Сохранено.")
         except Exception as e:
@@ -230,28 +358,63 @@ class NodeGraphEditor(QWidget):
         except Exception:
             pass
         self._sidecar_meta = {}
+        self._applied_meta_key = None
+        self._last_meta_payload = None
+        self._invalidate_meta_store()
         self.controller.node_positions.clear()
         self.controller.node_colors.clear()
         QMessageBox.information(self, "Метаданные", "Мета очищена.")
 
-    def _on_metadata_changed(self):
+    def _on_metadata_changed(self, node_id: Optional[str] = None):
+        if node_id is not None:
+            self._dirty_meta_ids.add(node_id)
         self._meta_save_timer.start()
 
+    def hideEvent(self, event):
+        # Окно закрывают/прячут — отложенную запись меты выполняем сразу
+        if self._meta_save_timer.isActive():
+            self._meta_save_timer.stop()
+            self._save_sidecar_meta(silent=True)
+        super().hideEvent(event)
+
     # -------- helpers: сигнатуры/порядок --------
     def _enumerate_nodes(self, script: Script) -> List[AstNode]:
+        # Прямой порядок обхода (узел, затем его ветки) — стеком итераторов, без рекурсии
         out: List[AstNode] = []
-
-        def walk(body: List[AstNode]):
-            for n in body:
-                out.append(n)
-                if isinstance(n, If):
-                    for br in n.branches:
-                        walk(br.body)
-                    if n.else_body:
-                        walk(n.else_body)
-        walk(script.body)
+        stack = [iter(script.body)]
+        while stack:
+            n = next(stack[-1], None)
+            if n is None:
+                stack.pop()
+                continue
+            out.append(n)
+            if isinstance(n, If):
+                if n.else_body:
+                    stack.append(iter(n.else_body))
+                for br in reversed(n.branches):
+                    stack.append(iter(br.body))
         return out
 
+    def _flat_index(self) -> Tuple[List[AstNode], List[str]]:
+        """Узлы в порядке обхода и их ключи сайдкара `сигнатура#номер`; кэш до правки AST."""
+        ver = self.controller.ast_version
+        if ver != self._flat_version:
+            nodes = self._enumerate_nodes(self._ast)
+            sig = self._signature
+            counters: Dict[str, int] = {}
+            keys: List[str] = []
+            append = keys.append
+            for n in nodes:
+                key = sig(n)
+                idx = counters.get(key, 0) + 1
+                counters[key] = idx
+                append(f"{key}#{idx}")
+            self._flat_nodes = nodes
+            self._flat_keys = keys
+            self._flat_key_of = {n.id: k for n, k in zip(nodes, keys)}
+            self._flat_version = ver
+        return self._flat_nodes, self._flat_keys
+
     def _signature(self, n: AstNode) -> str:
         if isinstance(n, Set):
             return f"SET|{'1' if n.local else '0'}|{n.var}|{n.expr}"
@@ -270,30 +433,33 @@ class NodeGraphEditor(QWidget):
     def _apply_sidecar_positions_colors(self):
         if not self._sidecar_meta:
             return
+        # Та же мета уже применена к тем же элементам того же AST — повторно не двигаем
+        key = (self.controller.ast_version, self.controller.build_count)
+        if key == self._applied_meta_key:
+            return
+        self._applied_meta_key = key
         nodes_map: Dict[str, Dict[str, Any]] = self._sidecar_meta.get("nodes", {}) or {}
-        counters: Dict[str, int] = {}
-        for n in self._enumerate_nodes(self._ast):
-            key = self._signature(n)
-            idx = counters.get(key, 0) + 1
-            counters[key] = idx
-            full_key = f"{key}#{idx}"
-            ent = nodes_map.get(full_key)
-            if not ent:
-                continue
-            item = self.controller.node2item.get(n.id)
-            if not item:
-                continue
-            pos = ent.get("pos")
-            if isinstance(pos, list) and len(pos) == 2:
-                item.setPos(float(pos[0]), float(pos[1]))
-                self.controller.node_positions[n.id] = QPointF(float(pos[0]), float(pos[1]))
-            col = ent.get("color")
-            if isinstance(col, str) and len(col) >= 4:
-                try:
-                    from PySide6.QtGui import QColor
-                    item.set_custom_color(QColor(col))
-                except Exception:
-                    pass
+        get_item = self.controller.node2item.get
+        positions = self.controller.node_positions
+        # Массовые setPos/цвета — без переиндексации сцены на каждом элементе
+        with self.scene.batched_updates():
+            for n, full_key in zip(*self._flat_index()):
+                ent = nodes_map.get(full_key)
+                if not ent:
+                    continue
+                item = get_item(n.id)
+                if not item:
+                    continue
+                pos = ent.get("pos")
+                if isinstance(pos, list) and len(pos) == 2:
+                    item.setPos(float(pos[0]), float(pos[1]))
+                    positions[n.id] = QPointF(float(pos[0]), float(pos[1]))
+                col = ent.get("color")
+                if isinstance(col, str) and len(col) >= 4:
+                    try:
+                        item.set_custom_color(color_from_name(col))
+                    except Exception:
+                        pass
 
         sp = self._sidecar_meta.get("start_pos")
         if isinstance(sp, list) and len(sp) == 2 and self._start_item and self._is_item_alive(self._start_item):
@@ -302,21 +468,11 @@ class NodeGraphEditor(QWidget):
     # -------- scene fitting --------
     def _fit_scene_rect(self, pad: float = 200.0):
         try:
-            items = list(self.scene.items())
-            if not items:
-                from PySide6.QtCore import QRectF
+            # Объединение рамок всех элементов считает сам Qt
+            rect = self.scene.itemsBoundingRect()
+            if rect.isNull():
                 self.scene.setSceneRect(QRectF(-1000, -1000, 2000, 2000))
                 return
-            rect = None
-            for it in items:
-                try:
-                    r = it.sceneBoundingRect()
-                except Exception:
-                    continue
-                rect = r if rect is None else rect.united(r)
-            if rect is None:
-                from PySide6.QtCore import QRectF
-                rect = QRectF(-1000, -1000, 2000, 2000)
             rect = rect.adjusted(-pad, -pad, pad, pad)
             min_w, min_h = 2000.0, 1200.0
             if rect.width() < min_w: rect.setWidth(min_w)
@@ -334,16 +490,34 @@ class NodeGraphEditor(QWidget):
 
     # -------- public --------
     def load_text(self, text: str):
-        self.preview.setPlainText(text)
+        self._refresh_timer.stop()  # новый текст важнее отложенной перегенерации
+        self._ast_timer.stop()
+        self._ast_rebuild_pending = False
+        self._file_cache.clear()
+        self._preview_cache.clear()
+        self._resolved_paths.clear()
+        # Полная замена текста: подсветку отключаем, один проход — после подключения обратно
+        self._highlighter.setDocument(None)
+        try:
+            self.preview.setPlainText(text)
+        finally:
+            self._highlighter.setDocument(self.preview.document())
         self._rebuild_from_preview_text()
 
     def export_text(self) -> str:
+        self._flush_refresh()
         return self.preview.toPlainText()
 
     # -------- parse/build --------
-    def _rebuild_from_preview_text(self):
+    def _rebuild_from_preview_text(self, only_if_changed: bool = False):
+        """Разбирает текст превью и перестраивает граф (раскладка заново, поверх — сайдкар).
+        only_if_changed — для неявных вызовов: тот же текст и неизменённый граф не трогаем."""
+        self._flush_refresh()
         try:
             txt = self.preview.toPlainText()
+            if (only_if_changed and txt == self._parsed_text and not self._errors
+                    and self._parsed_version == self.controller.ast_version):
+                return
             ast, errs = parse_script(txt)
             self._ast = ast
             self._errors = errs
@@ -351,35 +525,117 @@ class NodeGraphEditor(QWidget):
                 msg = "\n".join(str(e) for e in errs)
                 QMessageBox.warning(self, "Парсер DSL", msg)
             self.controller.set_ast(self._ast)
-            self.controller.rebuild(keep_positions=False)
-            self._ensure_start_node()
-            self._apply_sidecar_positions_colors()
-            self._draw_start_edge()
+            with self._bulk_scene_update():
+                self.controller.rebuild(keep_positions=False)
+                self._invalidate_meta_store()
+                self._ensure_start_node()
+                self._apply_sidecar_positions_colors()
+                self._draw_start_edge()
+            self._parsed_text = txt
+            self._parsed_version = self.controller.ast_version
         except Exception as e:
-            QMessageBox.critical(self, "NodeGraphEditor", f"Ошибка rebuild:\n{e}\n{traceback.format_exc()}")
+            self._report_error("NodeGraphEditor", "Ошибка rebuild", e)
         self._fit_scene_rect()
 
+    @contextmanager
+    def _bulk_scene_update(self):
+        """Пересборка сцены: вид не перерисовывается, сцена без индекса и сигналов — до конца блока."""
+        enabled = self.view.updatesEnabled()
+        self.view.setUpdatesEnabled(False)
+        try:
+            with self.scene.batched_updates():
+                yield
+        finally:
+            self.view.setUpdatesEnabled(enabled)
+            if enabled:
+                self.view.viewport().update()  # одна перерисовка за весь блок
+
+    def _report_error(self, title: str, what: str, e: Exception):
+        # Трассировку формируем один раз: полностью — в лог, в окно — только если приложение запущено с DEBUG
+        # (модульный логгер принудительно в DEBUG, поэтому смотрим на корневой)
+        tb = traceback.format_exc()
+        log.error("%s: %s\n%s", what, e, tb)
+        detail = f"\n{tb}" if logging.getLogger().isEnabledFor(logging.DEBUG) else ""
+        QMessageBox.critical(self, title, f"{what}:\n{e}{detail}")
+
     # -------- inspector / preview --------
     def _on_node_selected(self, ast_node: AstNode):
         self.inspector.set_ast(ast_node)
 
     def _on_ast_changed(self):
+        # AST уже изменён инспектором: версию (ключ кэшей текста/меты) поднимаем сразу,
+        # откладываем только перестройку сцены
+        self.controller.mark_ast_changed(self.inspector.current_ast())
+        self._ast_rebuild_pending = True
+        self._ast_timer.start()
+
+    def _apply_ast_changes(self):
+        self._ast_timer.stop()
+        if not self._ast_rebuild_pending:
+            return
+        self._ast_rebuild_pending = False
         try:
-            self.controller.rebuild(keep_positions=True)
-            self._ensure_start_node()
-            self._apply_sidecar_positions_colors()
-            self._draw_start_edge()
-            self._fit_scene_rect()
-            self._refresh_preview()
+            with self._bulk_scene_update():
+                self.controller.rebuild(keep_positions=True)
+                self._invalidate_meta_store()
+                self._ensure_start_node()
+                self._apply_sidecar_positions_colors()
+                self._draw_start_edge()
+            self._schedule_refresh()
         except Exception as e:
-            QMessageBox.critical(self, "NodeGraphEditor", f"Ошибка обновления AST:\n{e}\n{traceback.format_exc()}")
+            self._report_error("NodeGraphEditor", "Ошибка обновления AST", e)
+
+    def _schedule_refresh(self):
+        self._refresh_timer.start()
+
+    def _flush_refresh(self):
+        # Отложенное обновление — выполнить сейчас, если кто-то читает текст превью
+        self._apply_ast_changes()
+        if self._refresh_timer.isActive():
+            self._refresh_timer.stop()
+            self._do_refresh()
+
+    def _do_refresh(self):
+        self._fit_scene_rect()
+        self._refresh_preview()
+
+    def _generated_text(self) -> str:
+        # Любая правка AST поднимает версию в контроллере — до неё текст можно не пересобирать
+        ver = self.controller.ast_version
+        if ver != self._codegen_version:
+            self._codegen_text = generate_script(self._ast)
+            self._codegen_version = ver
+        return self._codegen_text
 
     def _refresh_preview(self):
+        text = self._generated_text()
+        # Тот же текст — не сбрасываем документ (подсветка, курсор, undo)
+        old = self.preview.toPlainText()
+        if text == old:
+            return
+        # Заменяем только расходящийся участок: раскладка и подсветка пересчитываются на нём
+        pre, suf = _common_affixes(old, text)
+        start = _utf16_len(old[:pre])
+        end = start + _utf16_len(old[pre:len(old) - suf])
+        # Сгенерированный текст — не правка пользователя: в undo не пишем,
+        # а отключение undo сбрасывает стек, как раньше это делал setPlainText
+        doc = self.preview.document()
+        undo = doc.isUndoRedoEnabled()
+        doc.setUndoRedoEnabled(False)
         self.preview.blockSignals(True)
-        self.preview.setPlainText(generate_script(self._ast))
-        self.preview.blockSignals(False)
+        try:
+            cur = QTextCursor(doc)
+            cur.beginEditBlock()
+            cur.setPosition(start)
+            cur.setPosition(end, QTextCursor.KeepAnchor)
+            cur.insertText(text[pre:len(text) - suf])
+            cur.endEditBlock()
+        finally:
+            self.preview.blockSignals(False)
+            doc.setUndoRedoEnabled(undo)
 
     def _apply_ast_to_preview(self):
+        self._flush_refresh()
         self._refresh_preview()
         self.text_updated.emit(self.preview.toPlainText())
         self._save_sidecar_meta(silent=True)
@@ -410,11 +666,22 @@ class NodeGraphEditor(QWidget):
         self.controller.refresh_edges()
         if not (self._start_item and self._is_item_alive(self._start_item)):
             self._ensure_start_node()
-        if self._ast.body:
-            first = self._ast.body[0]
-            it_first = self.controller.node2item.get(first.id)
-            if it_first and self._start_item and self._is_item_alive(self._start_item):
-                self.scene.add_edge_between_ports(self._start_item.out_port("exec"), it_first.in_port("exec"))
+        if not (self._start_item and self._is_item_alive(self._start_item)):
+            return
+        # refresh_edges трогает только рёбра AST — ребро от старта сверяем сами
+        out = self._start_item.out_port("exec")
+        if out is None:
+            return
+        it_first = self.controller.node2item.get(self._ast.body[0].id) if self._ast.body else None
+        dst = it_first.in_port("exec") if it_first else None
+        keep = None
+        for e in tuple(out.edges):
+            if keep is None and dst is not None and e.target is dst and e.scene() is not None:
+                keep = e  # уже ведёт к первому узлу — оставляем как есть
+            else:
+                e.destroy()
+        if keep is None and dst is not None:
+            self.scene.add_edge_between_ports(out, dst)
 
     # -------- connections --------
     def _on_connection_finished(self, src: PortItem, dst: PortItem):
@@ -425,17 +692,17 @@ class NodeGraphEditor(QWidget):
                     self.controller._remove_from_parent(dst_node)
                     self._ast.body.insert(0, dst_node)
                     self.controller.parent_map[dst_node.id] = self._ast.body
+                    self.controller.mark_ast_changed(dst_node)
                     self._draw_start_edge()
-                    self._refresh_preview()
+                    self._schedule_refresh()
                 return
 
             self.controller.connect_ports(src, dst)
             self._draw_start_edge()
-            self._fit_scene_rect()
-            self._refresh_preview()
-            self._save_sidecar_meta(silent=True)
+            self._schedule_refresh()
+            self._on_metadata_changed()  # запись меты — отложенная, одна на серию правок
         except Exception as e:
-            QMessageBox.critical(self, "NodeGraphEditor", f"Ошибка соединения:\n{e}\n{traceback.format_exc()}")
+            self._report_error("NodeGraphEditor", "Ошибка соединения", e)
 
     # -------- creation menu --------
     def _on_request_create_menu(self, source_port: Optional[PortItem], scene_pos):
@@ -445,27 +712,17 @@ class NodeGraphEditor(QWidget):
         except RuntimeError:
             source_port = None
 
-        menu = QMenu(self)
-        a_set = menu.addAction("SET")
-        a_log = menu.addAction("LOG")
-        a_asi = menu.addAction("ADD_SYSTEM_INFO")
-        a_ret = menu.addAction("RETURN")
-        a_if = menu.addAction("IF")
+        if self._create_menu is None:
+            # Меню и его действия создаются один раз и переиспользуются
+            self._create_menu = QMenu(self)
+            self._create_factories = {self._create_menu.addAction(label): make
+                                      for label, make in self._CREATE_MENU}
 
-        act = menu.exec(self.view.mapToGlobal(self.view.mapFromScene(scene_pos)))
-        if not act:
+        act = self._create_menu.exec(self.view.mapToGlobal(self.view.mapFromScene(scene_pos)))
+        make = self._create_factories.get(act)
+        if make is None:
             return
-
-        if act == a_set:
-            node = Set(var="var", expr="0", local=False)
-        elif act == a_log:
-            node = Log(expr='"debug"')
-        elif act == a_asi:
-            node = AddSystemInfo(expr='LOAD "Main/part.txt"')
-        elif act == a_ret:
-            node = Return(expr='"text"')
-        else:
-            node = If(branches=[IfBranch(cond="True")])
+        node = make()
 
         self.controller.insert_after(None, node)
         self.controller.create_item_for_node(node, scene_pos)
@@ -488,9 +745,8 @@ class NodeGraphEditor(QWidget):
                             self.controller.connect_ports(src_port_new, dst_port_new)
 
         self._draw_start_edge()
-        self._fit_scene_rect()
-        self._refresh_preview()
-        self._save_sidecar_meta(silent=True)
+        self._schedule_refresh()
+        self._on_metadata_changed()
 
     # -------- file picker --------
     def _pick_file_for_attach(self) -> Optional[str]:
@@ -499,94 +755,167 @@ class NodeGraphEditor(QWidget):
                                               "Текстовые файлы (*.txt *.script *.system);;Все файлы (*)")
         if not path:
             return None
+        abspath = os.path.abspath(path)
+        key = os.path.normcase(abspath)
         try:
-            abspath = os.path.abspath(path)
-            if self._base_dir and os.path.commonpath([abspath, os.path.abspath(self._base_dir)]) == os.path.abspath(self._base_dir):
-                rel = os.path.relpath(abspath, self._base_dir); return rel.replace("\\", "/")
-            if self._prompts_root and os.path.commonpath([abspath, os.path.abspath(self._prompts_root)]) == os.path.abspath(self._prompts_root):
-                rel = os.path.relpath(abspath, self._prompts_root); return rel.replace("\\", "/")
-        except Exception:
+            for root in self._abs_roots():
+                # Префикс по каталогу вместо commonpath; relpath бросит ValueError на другом диске
+                prefix = os.path.normcase(root).rstrip(os.sep) + os.sep
+                if key.startswith(prefix):
+                    return os.path.relpath(abspath, root).replace("\\", "/")
+        except ValueError:
             pass
         return path
 
+    def _abs_roots(self) -> Tuple[str, ...]:
+        # Абсолютные base_dir / prompts_root (в порядке приоритета) — считаются один раз
+        if self._abs_roots_cache is None:
+            self._abs_roots_cache = tuple(os.path.abspath(r) for r in (self._base_dir, self._prompts_root) if r)
+        return self._abs_roots_cache
+
     # -------- preview helpers --------
     def _resolve_path(self, rel_path: str) -> Optional[str]:
         if not rel_path: return None
-        if os.path.isabs(rel_path) and os.path.exists(rel_path): return rel_path
-        if self._base_dir:
-            p = os.path.normpath(os.path.join(self._base_dir, rel_path))
-            if os.path.exists(p): return p
-        if self._prompts_root:
-            p = os.path.normpath(os.path.join(self._prompts_root, rel_path))
+        # Кэшируем только найденные пути: пропавший файл отбрасывается в _load_stamp,
+        # а ещё не созданный продолжаем искать при каждом запросе
+        hit = self._resolved_paths.get(rel_path)
+        if hit is not None: return hit
+        p = self._find_path(rel_path)
+        if p is not None:
+            self._resolved_paths[rel_path] = p
+        return p
+
+    def _find_path(self, rel_path: str) -> Optional[str]:
+        # Абсолютный путь: join с корнями вернул бы его же — хватает одной проверки
+        if os.path.isabs(rel_path): return rel_path if os.path.exists(rel_path) else None
+        # Корни уже абсолютные: найденный путь сразу годится для _load_stamp
+        for root in self._abs_roots():
+            p = os.path.normpath(os.path.join(root, rel_path))
             if os.path.exists(p): return p
         return None
 
-    def _read_file(self, path: str) -> str:
+    def _read_file(self, path: str, stamp: Optional[Tuple[int, int]] = None) -> str:
+        # Неизменившийся файл (тот же mtime/size) повторно не читаем и не декодируем;
+        # stamp — уже снятый (mtime_ns, size), чтобы не делать второй stat
+        cache = self._file_cache
         try:
+            if stamp is None:
+                st = os.stat(path)
+                stamp = (st.st_mtime_ns, st.st_size)
+            hit = cache.get(path)
+            if hit is not None and hit[0] == stamp:
+                cache.move_to_end(path)
+                return hit[1]
             with open(path, "r", encoding="utf-8") as f:
-                return f.read()
+                text = f.read()
+            cache[path] = (stamp, text)
+            cache.move_to_end(path)
+            if len(cache) > 64:
+                cache.popitem(last=False)
+            return text
         except Exception as e:
+            cache.pop(path, None)
             return f"[Ошибка чтения файла: {e}]"
 
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _tag_patterns(tag_up: str) -> Tuple[re.Pattern, re.Pattern]:
+        tag = re.escape(tag_up)
+        flags = re.IGNORECASE
+        return (re.compile(NodeGraphEditor._TAG_OPEN_RE_TMPL.format(tag=tag), flags),
+                re.compile(NodeGraphEditor._TAG_CLOSE_RE_TMPL.format(tag=tag), flags))
+
     def _extract_tag_section(self, raw: str, tag_name: str) -> str:
-        tag_up = tag_name.upper()
-        pattern = re.compile(self._TAG_SECTION_RE_TMPL.format(tag=re.escape(tag_up)), re.IGNORECASE | re.DOTALL)
-        m = pattern.search(raw)
-        if not m:
+        # Вместо ленивого (.*?) по всему файлу: первый открывающий маркер,
+        # затем первый закрывающий после него; пробелы перед ним не входят в секцию
+        open_re, close_re = self._tag_patterns(tag_name.upper())
+        mo = open_re.search(raw)
+        mc = close_re.search(raw, mo.end()) if mo else None
+        if not mc:
             return f"[Тег [#{tag_name}] не найден]"
-        content = m.group(1)
+        content = raw[mo.end():mc.start()].rstrip()
         if content.startswith("\n"):
             content = content[1:]
         return content
 
     def _remove_tag_markers(self, text: str) -> str:
+        # Маркер всегда начинается с "[#" или "[/": без них regex по файлу не гоняем
+        if "[#" not in text and "[/" not in text:
+            return text
         return self._SECTION_MARKER_RE.sub("", text)
 
     def _delete_selected_nodes(self):
-        selected = [it for it in self.scene.selectedItems() if hasattr(it, "payload")]
-        removed_any = False
-        for it in selected:
-            ast = getattr(it, "payload", None)
-            if isinstance(ast, AstNode):
-                self.controller.delete_node(ast)
-                removed_any = True
-        if removed_any:
-            self.controller.rebuild(keep_positions=True)
-            self._ensure_start_node()
-            self._apply_sidecar_positions_colors()
-            self._draw_start_edge()
-            self._fit_scene_rect()
-            self._refresh_preview()
-            self._save_sidecar_meta(silent=True)
+        get_node = self.controller.item2node.get
+        nodes = [n for n in map(get_node, self.scene.selectedItems()) if isinstance(n, AstNode)]
+        if nodes:
+            with self._bulk_scene_update():
+                self.controller.delete_nodes(nodes)
+                self._invalidate_meta_store()
+                self._ensure_start_node()
+                self._apply_sidecar_positions_colors()
+                self._draw_start_edge()
+            self._schedule_refresh()
+            self._on_metadata_changed()
+
+    def _load_stamp(self, rel: str) -> Optional[Tuple[str, int, int]]:
+        """(путь, mtime_ns, size) файла из LOAD или None, если он не найден."""
+        path = self._resolve_path(rel) or rel
+        if not os.path.isabs(path):
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            if self._resolved_paths.pop(rel, None) is not None:
+                return self._load_stamp(rel)  # файл по кэшированному пути пропал — ищем заново
+            return None
+        return path, st.st_mtime_ns, st.st_size
 
     def _preview_for_expr(self, expr: str) -> str:
         if not expr: return ""
+        # Результат по выражению переиспользуем, пока файлы-зависимости те же (путь, mtime, size)
+        cache = self._preview_cache
+        stamp = self._load_stamp
+        hit = cache.get(expr)
+        if hit is not None and all(stamp(rel) == st for rel, st in hit[1]):
+            cache.move_to_end(expr)
+            return hit[0]
         chunks: List[str] = []
-        for m in self._INLINE_LOAD_RE.finditer(expr):
-            tag = m.group(1); rel = m.group(3)
-            path = self._resolve_path(rel) or rel
-            if not os.path.isabs(path) or not os.path.exists(path):
-                chunks.append(f"[файл не найден: {rel}]"); continue
-            raw = self._read_file(path)
-            if tag: content = self._extract_tag_section(raw, tag)
-            else:   content = self._remove_tag_markers(raw)
-            chunks.append(content)
-        for m in self._LOAD_REL_RE.finditer(expr):
-            rel = m.group(2)
-            path = self._resolve_path(rel) or rel
-            if not os.path.isabs(path) or not os.path.exists(path):
-                chunks.append(f"[файл не найден: {rel}]"); continue
-            raw = self._read_file(path)
-            content = self._remove_tag_markers(raw)
-            chunks.append(content)
-        return "\n\n---\n\n".join(chunks) if chunks else ""
+        append = chunks.append
+        read = self._read_file
+        extract = self._extract_tag_section
+        strip_markers = self._remove_tag_markers
+        deps: Dict[str, Optional[Tuple[str, int, int]]] = {}
+        # Повторные LOAD того же файла/секции берут уже готовый фрагмент
+        seen: Dict[Tuple[str, Optional[str]], str] = {}
+        for m in self._LOAD_ANY_RE.finditer(expr):
+            inline, rel, tag = m.group("inline", "rel", "tag")
+            if inline is not None: rel = inline
+            if rel in deps: st = deps[rel]
+            else:           st = deps[rel] = stamp(rel)
+            if st is None:
+                append(f"[файл не найден: {rel}]"); continue
+            tag = tag or None
+            key = (st[0], tag)
+            content = seen.get(key)
+            if content is None:
+                raw = read(st[0], st[1:])
+                content = seen[key] = extract(raw, tag) if tag else strip_markers(raw)
+            append(content)
+        result = "\n\n---\n\n".join(chunks) if chunks else ""
+        cache[expr] = (result, tuple(deps.items()))
+        if len(cache) > 512:
+            cache.popitem(last=False)
+        return result
 
     # -------------------- RUNNER --------------------
     def _run_workflow(self):
         try:
-            self._rebuild_from_preview_text()
+            self._rebuild_from_preview_text(only_if_changed=True)
             self.controller.clear_all_previews()
 
+            from logic.dsl_runner import DslAstRunner
+            from ui.node_graph.runner_result_dialog import RunnerResultDialog
+
             base = os.path.dirname(self._file_path) if self._file_path else self._base_dir
             runner = DslAstRunner(base_dir=base, prompts_root=self._prompts_root)
 
@@ -600,35 +929,44 @@ class NodeGraphEditor(QWidget):
             # Сначала очистим подсветки пути
             self.controller.clear_path_highlight()
 
+            flat_nodes, _keys = self._flat_index()
+            results_get = report.node_results.get
+            set_preview = self.controller.set_node_preview
+            ret_preview: Optional[str] = None  # одинаков для всех RETURN — считаем один раз
+            if_choices: List[Tuple[If, str]] = []
+
             # Проставим кармашки превью
-            for n in self._enumerate_nodes(self._ast):
-                info = report.node_results.get(n.id)
+            for n in flat_nodes:
+                info = results_get(n.id)
                 if not info:
                     continue
+                t = type(n)
 
                 # IF: показываем значения переменных, участвующих в условиях
-                if isinstance(n, If):
+                if t is If:
                     snap = snapshots_before.get(n.id, report.vars_before)
                     text = self._build_if_vars_preview(n, snap, info)
-                    self.controller.set_node_preview(n, text, error=bool(info.error))
+                    set_preview(n, text, error=bool(info.error))
+                    if info.chosen_branch_key:
+                        if_choices.append((n, info.chosen_branch_key))
                 # RETURN — показываем текст (сокращённо) + подсказка про двойной клик
-                elif isinstance(n, Return) and info.error is None:
-                    full = report.final_text or ""
-                    short = (full[:240] + "…") if len(full) > 240 else full
-                    suffix = "  ⟶ двойной клик для полного текста"
-                    self.controller.set_node_preview(n, f"{short}\n{suffix}", error=False)
+                elif t is Return and info.error is None:
+                    if ret_preview is None:
+                        full = report.final_text or ""
+                        short = (full[:240] + "…") if len(full) > 240 else full
+                        suffix = "  ⟶ двойной клик для полного текста"
+                        ret_preview = f"{short}\n{suffix}"
+                    set_preview(n, ret_preview, error=False)
                 else:
-                    self.controller.set_node_preview(n, info.preview or "", error=bool(info.error))
+                    set_preview(n, info.preview or "", error=bool(info.error))
 
             # Подсветить маршрут исполнения (зелёным) — exec-цепочки
             self.controller.highlight_exec_sequence(report.exec_trace)
 
             # Подсветить выбранные ветки IF (зелёным)
-            for n in self._enumerate_nodes(self._ast):
-                if isinstance(n, If):
-                    info = report.node_results.get(n.id)
-                    if info and info.chosen_branch_key:
-                        self.controller.highlight_if_choice(n, info.chosen_branch_key)
+            hl_if = self.controller.highlight_if_choice
+            for n, key in if_choices:
+                hl_if(n, key)
 
             # Диалог: шаги
             steps = self._build_steps_for_dialog(report)
@@ -646,7 +984,7 @@ class NodeGraphEditor(QWidget):
             dlg.show()
 
         except Exception as e:
-            QMessageBox.critical(self, "Запуск воркфлоу", f"Ошибка выполнения:\n{e}\n{traceback.format_exc()}")
+            self._report_error("Запуск воркфлоу", "Ошибка выполнения", e)
 
     # -------- vars provider / DSL Dock integration --------
     def _fetch_initial_vars(self) -> Dict[str, Any]:
@@ -666,7 +1004,7 @@ class NodeGraphEditor(QWidget):
                 if hasattr(ancestor, "vars_dock") and hasattr(ancestor.vars_dock, "editor"):
                     ed = ancestor.vars_dock.editor()
                     txt = ed.toPlainText()
-                    return self._parse_vars_text(txt)
+                    return parse_vars_text(txt)
                 ancestor = ancestor.parent()
         except Exception:
             pass
@@ -681,46 +1019,17 @@ class NodeGraphEditor(QWidget):
                 rel_path = rel.relative_to(root)
                 char_id = str(rel_path.parts[0]) if rel_path.parts else None
 
-            from utils.config_utils import read_config_json, compute_defaults_for_char, get_bounds_defaults
+            from utils.config_utils import read_config_json, merged_defaults_for_char
             result = {}
             if char_id:
                 cfg = read_config_json(self._prompts_root, char_id) or {}
-                base = compute_defaults_for_char(char_id) or {}
+                base = dict(merged_defaults_for_char(char_id))
                 base.update(cfg)
-                for k, v in get_bounds_defaults().items():
-                    base.setdefault(k, v)
                 result = base
             return result if isinstance(result, dict) else {}
         except Exception:
             return {}
 
-    def _parse_vars_text(self, txt: str) -> Dict[str, Any]:
-        out: Dict[str, Any] = {}
-        if not txt:
-            return out
-        for line in txt.splitlines():
-            if "=" not in line:
-                continue
-            k, v = map(str.strip, line.split("=", 1))
-            if not k:
-                continue
-            low = v.lower()
-            if low in ("true", "false"):
-                out[k] = (low == "true")
-                continue
-            try:
-                out[k] = int(v)
-                continue
-            except Exception:
-                pass
-            try:
-                out[k] = float(v)
-                continue
-            except Exception:
-                pass
-            out[k] = v.strip("'\"")
-        return out
-
     # -------- build steps for dialog --------
     def _build_steps_for_dialog(self, report: RunnerReport) -> List[Dict[str, Any]]:
         steps: List[Dict[str, Any]] = []
@@ -752,6 +1061,13 @@ class NodeGraphEditor(QWidget):
         return steps
 
     # --------- double click on node => open full details --------
+    @classmethod
+    def _details_font(cls) -> QFont:
+        # Шрифт один на все окна деталей — создаётся при первом открытии
+        if cls._details_font_cache is None:
+            cls._details_font_cache = QFont("Consolas", 10)
+        return cls._details_font_cache
+
     def _on_item_double_clicked(self, node: AstNode):
         rep = self._last_runner_report
         if not rep:
@@ -766,41 +1082,67 @@ class NodeGraphEditor(QWidget):
             body_lines.append(rep.final_text or "")
         else:
             body_lines.append(f"Тип: {type(node).__name__}")
-            if info and info.line_num:
-                body_lines.append(f"Строка: {info.line_num}")
-            if getattr(info, "expr", None):
-                body_lines.append(f"\nВыражение:\n{info.expr}")
-            if info and info.error:
-                body_lines.append(f"\nОШИБКА:\n{info.error}")
-            if info and info.preview:
-                body_lines.append(f"\nПревью:\n{info.preview}")
-            if info and info.vars_delta:
-                body_lines.append("\nИзменения переменных:")
-                for k, (old, new) in info.vars_delta.items():
-                    body_lines.append(f"  {k}: {repr(old)} -> {repr(new)}")
-            if info and info.sys_info_added:
-                body_lines.append("\nADD_SYSTEM_INFO (полный фрагмент):")
-                body_lines.append(info.sys_info_added)
+            if info:
+                if info.line_num:
+                    body_lines.append(f"Строка: {info.line_num}")
+                if getattr(info, "expr", None):
+                    body_lines.append(f"\nВыражение:\n{info.expr}")
+                if info.error:
+                    body_lines.append(f"\nОШИБКА:\n{info.error}")
+                if info.preview:
+                    body_lines.append(f"\nПревью:\n{info.preview}")
+                delta = info.vars_delta
+                if delta:
+                    body_lines.append("\nИзменения переменных:")
+                    body_lines.extend(f"  {k}: {old!r} -> {new!r}" for k, (old, new) in delta.items())
+                if info.sys_info_added:
+                    body_lines.append("\nADD_SYSTEM_INFO (полный фрагмент):")
+                    body_lines.append(info.sys_info_added)
 
         dlg = QDialog(self)
         dlg.setWindowTitle(title)
         dlg.setMinimumSize(720, 520)
         v = QVBoxLayout(dlg)
+        body = "\n".join(body_lines)
         txt = QPlainTextEdit()
         txt.setReadOnly(True)
-        txt.setFont(QFont("Consolas", 10))
-        txt.setPlainText("\n".join(body_lines))
+        txt.setFont(self._details_font())
+        # Без переносов и undo раскладка большого текста заметно дешевле
+        txt.setLineWrapMode(QPlainTextEdit.NoWrap)
+        txt.document().setUndoRedoEnabled(False)
+        # Огромный результат показываем частями: хвост — по кнопке
+        head, rest = body, ""
+        if len(body) > self._DETAILS_FULL_LIMIT:
+            cut = body.rfind("\n", 0, self._DETAILS_HEAD_CHARS)
+            if cut <= 0:
+                cut = self._DETAILS_HEAD_CHARS
+            head, rest = body[:cut], body[cut:]
+        txt.setPlainText(head)
         v.addWidget(txt)
         btns = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Save | QDialogButtonBox.Copy)
+        if rest:
+            btn_more = btns.addButton(f"Показать полностью (ещё {len(rest)} симв.)", QDialogButtonBox.ActionRole)
+            def _show_rest():
+                btn_more.setEnabled(False)
+                txt.setUpdatesEnabled(False)
+                try:
+                    cur = QTextCursor(txt.document())
+                    cur.movePosition(QTextCursor.End)
+                    cur.insertText(rest)
+                finally:
+                    txt.setUpdatesEnabled(True)
+                btn_more.hide()
+            btn_more.clicked.connect(_show_rest)
+        # Копирование и сохранение — всегда полный текст, даже если показан не весь
         def _copy():
             from PySide6.QtWidgets import QApplication
-            QApplication.clipboard().setText(txt.toPlainText() or "")
+            QApplication.clipboard().setText(body)
         def _save():
             path, _ = QFileDialog.getSaveFileName(self, "Сохранить текст", os.getcwd(), "Текст (*.txt)")
             if path:
                 try:
                     with open(path, "w", encoding="utf-8") as f:
-                        f.write(txt.toPlainText())
+                        f.write(body)
                 except Exception as e:
                     QMessageBox.critical(self, "Сохранение", f"Ошибка: {e}")
         btns.button(QDialogButtonBox.Copy).clicked.connect(_copy)
@@ -38,6 +38,17 @@ PREV_BG = QColor(32, 32, 32, 220)
 PREV_BR = QColor("#3a3a3a")
 PREV_TEXT = QColor("#E0E0E0")
 
+# Пользовательские цвета нод: палитра маленькая, одна строка -> один разобранный QColor.
+# Экземпляры общие — не мутировать.
+_color_cache: Dict[str, QColor] = {}
+
+
+def color_from_name(name: str) -> QColor:
+    c = _color_cache.get(name)
+    if c is None:
+        c = _color_cache[name] = QColor(name)
+    return c
+
 
 class PortItem(QGraphicsEllipseItem):
     R = 5
@@ -250,6 +261,9 @@ class NodeItem(QGraphicsRectItem):
         self._default_bg = bg
         self._in_ports: List[PortItem] = []
         self._out_ports: List[PortItem] = []
+        # key -> порт, чтобы in_port/out_port не сканировали списки
+        self._in_port_map: Dict[str, PortItem] = {}
+        self._out_port_map: Dict[str, PortItem] = {}
         self._port_labels_internal: Dict[str, QGraphicsSimpleTextItem] = {}
         self._on_moved: Optional[Callable[["NodeItem"], None]] = None
         self._on_color_changed: Optional[Callable[["NodeItem"], None]] = None
@@ -447,6 +461,7 @@ class NodeItem(QGraphicsRectItem):
         p = PortItem(self, key, True)
         p.setToolTip(label)
         self._in_ports.append(p)
+        self._in_port_map.setdefault(key, p)
         self._layout_ports()
         return p
 
@@ -454,6 +469,7 @@ class NodeItem(QGraphicsRectItem):
         p = PortItem(self, key, False)
         p.setToolTip(label)
         self._out_ports.append(p)
+        self._out_port_map.setdefault(key, p)
         if key != "exec":
             lab = QGraphicsSimpleTextItem(label, self)
             lab.setBrush(QBrush(TEXT_SECONDARY))
@@ -465,16 +481,10 @@ class NodeItem(QGraphicsRectItem):
         return p
 
     def in_port(self, key: str) -> Optional[PortItem]:
-        for p in self._in_ports:
-            if p.key == key:
-                return p
-        return None
+        return self._in_port_map.get(key)
 
     def out_port(self, key: str) -> Optional[PortItem]:
-        for p in self._out_ports:
-            if p.key == key:
-                return p
-        return None
+        return self._out_port_map.get(key)
 
     def in_ports(self) -> List[PortItem]:
         return self._in_ports
@@ -1,5 +1,6 @@
 # ui/node_graph/graph_scene.py
 from __future__ import annotations
+from contextlib import contextmanager
 from typing import Optional
 import logging
 
@@ -145,26 +146,32 @@ class GraphScene(QGraphicsScene):
         if it and self._is_alive_item(it):
             self.node_selected.emit(it.payload)
 
+    @contextmanager
+    def batched_updates(self):
+        """Пакетные изменения: индекс и сигналы выключены, по выходу — один update()."""
+        method = self.itemIndexMethod()
+        self.setItemIndexMethod(QGraphicsScene.NoIndex)
+        blocked = self.blockSignals(True)
+        try:
+            yield self
+        finally:
+            self.blockSignals(blocked)
+            self.setItemIndexMethod(method)
+            self.update()
+
     def add_node_item(self, item: NodeItem, pos: QPointF):
         self.addItem(item)
         item.setPos(pos)
 
-    def add_edge_between_ports(self, src: Optional[PortItem], dst: Optional[PortItem], is_branch: bool = False):
+    def add_edge_between_ports(self, src: Optional[PortItem], dst: Optional[PortItem], is_branch: bool = False) -> Optional[EdgeItem]:
         if src is None or dst is None:
-            return
+            return None
         if not (self._is_alive_item(src) and self._is_alive_item(dst)):
-            return
+            return None
         edge = EdgeItem(src, dst, is_branch=is_branch)
         self.addItem(edge)
         edge.update_path()
-
-    def clear_edges(self):
-        for it in list(self.items()):
-            if isinstance(it, EdgeItem):
-                try:
-                    it.destroy()
-                except Exception:
-                    pass
+        return edge
 
 class GraphView(QGraphicsView):
     def __init__(self, scene: GraphScene, parent=None):
@@ -270,6 +270,9 @@ class Inspector(QWidget):
         self._ast = ast
         self._build()
 
+    def current_ast(self) -> Optional[AstNode]:
+        return self._ast
+
     # ---- авто-высота вкладок на основе высоты редактора ----
     def _sync_tabs_height(self, editor_h: int):
         try:
@@ -13,6 +13,8 @@ class SimplePromptHighlighter(QSyntaxHighlighter):
             self._rules.append((QRegularExpression(pattern), fmt))
 
     def highlightBlock(self, text: str):
+        if not text or text.isspace():
+            return
         for rx, fmt in self._rules:
             it = rx.globalMatch(text)
             while it.hasNext():
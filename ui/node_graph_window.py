@@ -44,7 +44,7 @@ class NodeGraphWindow(QMainWindow):
         tb.addAction(act_save)
 
         act_refresh = QAction("Пересобрать граф из текста", self)
-        act_refresh.triggered.connect(self.editor._rebuild_from_preview_text)
+        act_refresh.triggered.connect(lambda: self.editor._rebuild_from_preview_text())
         tb.addAction(act_refresh)
 
     def _apply_to_editor(self):
@@ -184,12 +184,10 @@ class FileTreePanel(QTreeView):
             QMessageBox.critical(self, "Ошибка создания", str(e))
 
     def _create_config_in_char_dir(self, char_dir: str):
-        from utils.config_utils import compute_defaults_for_char, get_bounds_defaults, write_config_json
+        from utils.config_utils import merged_defaults_for_char, write_config_json
         try:
             char_id = os.path.basename(char_dir.rstrip("/\\"))
-            cfg = compute_defaults_for_char(char_id)
-            for k, v in get_bounds_defaults().items():
-                cfg.setdefault(k, v)
+            cfg = dict(merged_defaults_for_char(char_id))
             write_config_json(self._prompts_root, char_id, cfg)
             QMessageBox.information(self, "config.json", f"Создан:\n{os.path.join(char_dir, 'config.json')}")
         except Exception as e:
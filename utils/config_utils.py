@@ -1,5 +1,19 @@
 # prompt_editor/utils/config_utils.py — module-level functions
+import json
+import os
+import stat
+from functools import lru_cache
+from types import MappingProxyType
+
+from utils import json_fast
+
+# path -> ((st_mtime_ns, st_size), данные) — повторно не читаем неизменившийся config.json
+_cfg_cache: dict[str, tuple[tuple[int, int], dict]] = {}
+
+
+@lru_cache(maxsize=None)
 def get_bounds_defaults() -> dict:
+    # Общий словарь на всех — только для чтения, не мутировать
     return {
         "attitude_min": 0.0, "attitude_max": 100.0,
         "boredom_min": 0.0,  "boredom_max": 100.0,
@@ -7,31 +21,45 @@ def get_bounds_defaults() -> dict:
     }
 
 def get_config_path(prompts_root: str | None, char_id: str | None) -> str:
-    import os
     if not (prompts_root and char_id):
         return ""
     return os.path.join(prompts_root, char_id, "config.json")
 
-def read_config_json(prompts_root: str | None, char_id: str | None, ensure_bounds: bool = True) -> dict | None:
-    import os, json
+def try_read_config_json(prompts_root: str | None, char_id: str | None, ensure_bounds: bool = True) -> tuple[bool, dict | None]:
+    # Один stat вместо пары isfile + open, содержимое — из кэша по (mtime, size): (существует, данные)
     path = get_config_path(prompts_root, char_id)
-    if not path or not os.path.isfile(path):
-        return None
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    if not path:
+        return False, None
+    try:
+        st = os.stat(path)
+        if not stat.S_ISREG(st.st_mode):
+            return False, None
+        key = (st.st_mtime_ns, st.st_size)
+        hit = _cfg_cache.get(path)
+        if hit is None or hit[0] != key:
+            with open(path, "rb") as f:
+                hit = (key, json_fast.loads(f.read()))
+            _cfg_cache[path] = hit
+    except (FileNotFoundError, NotADirectoryError):
+        _cfg_cache.pop(path, None)
+        return False, None
+    data = dict(hit[1])
     if ensure_bounds:
         for k, v in get_bounds_defaults().items():
             data.setdefault(k, v)
-    return data
+    return True, data
+
+def read_config_json(prompts_root: str | None, char_id: str | None, ensure_bounds: bool = True) -> dict | None:
+    return try_read_config_json(prompts_root, char_id, ensure_bounds)[1]
 
 def write_config_json(prompts_root: str | None, char_id: str | None, cfg: dict) -> None:
-    import os, json
     path = get_config_path(prompts_root, char_id)
     if not path:
         raise RuntimeError("Некорректный путь к config.json")
     os.makedirs(os.path.dirname(path), exist_ok=True)
     with open(path, "w", encoding="utf-8") as f:
         json.dump(cfg, f, indent=4, ensure_ascii=False)
+    _cfg_cache.pop(path, None)
 
 def compute_defaults_for_char(char_id: str) -> dict:
     from models.character import Character
@@ -46,6 +74,14 @@ def compute_defaults_for_char(char_id: str) -> dict:
             break
     return base
 
+@lru_cache(maxsize=32)
+def merged_defaults_for_char(char_id: str) -> MappingProxyType:
+    # Дефолты персонажа + границы; неизменяемый вид — для изменений делайте dict(...)
+    base = compute_defaults_for_char(char_id)
+    for k, v in get_bounds_defaults().items():
+        base.setdefault(k, v)
+    return MappingProxyType(base)
+
 def are_configs_equal(a: dict, b: dict) -> bool:
     def norm(v):
         if isinstance(v, bool):
@@ -57,4 +93,12 @@ def are_configs_equal(a: dict, b: dict) -> bool:
     for k in keys:
         if norm(a.get(k)) != norm(b.get(k)):
             return False
-    return True
\ No newline at end of file
+    return True
+
+def config_fingerprint(cfg: dict) -> int | None:
+    # Хэш, согласованный с are_configs_equal (1 == 1.0, None == отсутствие ключа).
+    # Разные отпечатки => конфиги точно различаются; None — есть нехэшируемые значения.
+    try:
+        return hash(frozenset((k, v) for k, v in cfg.items() if v is not None))
+    except TypeError:
+        return None
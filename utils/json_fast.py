@@ -0,0 +1,21 @@
+# prompt_editor/utils/json_fast.py — JSON через orjson, если он установлен, иначе stdlib
+import json
+from typing import Any
+
+try:  # необязательная зависимость — быстрее stdlib json
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
+
+def loads(raw: bytes | str) -> Any:
+    if _orjson is not None:
+        return _orjson.loads(raw)
+    return json.loads(raw)
+
+
+def dumps(data: Any, indent: bool = False) -> bytes:
+    # Всегда UTF-8 байты; indent — отступ в 2 пробела (orjson других не умеет)
+    if _orjson is not None:
+        return _orjson.dumps(data, option=_orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(data, indent=2 if indent else None, ensure_ascii=False).encode("utf-8")
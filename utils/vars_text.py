@@ -0,0 +1,32 @@
+# prompt_editor/utils/vars_text.py — разбор текста переменных `ключ = значение`
+import re
+
+# Числа — классификация без try/except вокруг int()/float()
+_INT_RE = re.compile(r"[+-]?\d+")
+_FLOAT_RE = re.compile(r"[+-]?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?")
+
+
+def parse_value(v: str):
+    """Строковое значение -> bool / int / float, иначе строка без обрамляющих кавычек."""
+    low = v.lower()
+    if low in ("true", "false"):
+        return low == "true"
+    if _INT_RE.fullmatch(v):
+        return int(v)
+    if _FLOAT_RE.fullmatch(v):
+        return float(v)
+    return v.strip("'\"")
+
+
+def parse_vars_text(text: str) -> dict:
+    """Строки `ключ = значение` -> dict; строки без `=` и с пустым ключом пропускаются."""
+    out = {}
+    if not text:
+        return out
+    for line in text.splitlines():
+        if "=" not in line:
+            continue
+        k, v = map(str.strip, line.split("=", 1))
+        if k:
+            out[k] = parse_value(v)
+    return out